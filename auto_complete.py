@@ -21,13 +21,13 @@ def filter_options(ordered_elm, *args):
 
 
 
-def get_cache_request_options(guild_id, request_type=None, name=None, effect=None):
+async def get_cache_request_options(guild_id, request_type=None, name=None, effect=None):
     """Get all the autocomplete options for requests"""
     cache = autocomplete_cache.get(REQUEST).get(guild_id)
     #If the cache doesnt exist or is stale
     if cache is None or cache[0].timestamp() + float(STALE_IN) < datetime.now().timestamp():
         #We will cache everything regardless of kwargs
-        cache = [datetime.now(), tools.ordered_requests(guild_id)]
+        cache = [datetime.now(), await tools.ordered_requests(guild_id)]
         autocomplete_cache[REQUEST][guild_id] = cache
     filtered_options = filter_options(cache[1], request_type, name, effect)
     return filtered_options
@@ -2,10 +2,14 @@
 
 # Imports
 import os
+import io
+import asyncio
 import logging
 from dotenv import load_dotenv
 from interactions import (
     Client,
+    Task,
+    IntervalTrigger,
     Intents,
     listen,
     SlashCommandChoice,
@@ -21,15 +25,18 @@ from interactions import (
     BaseChannel,
     AutocompleteContext,
     global_autocomplete,
+    File,
 )
 from interactions.api.events import MessageCreate, Component
 from interactions.ext.paginators import Paginator
-import dao
+from leaderboard import LeaderboardPaginator
+import dao.async_dao
 import business
 import tools
 import update
 import auto_complete
 import render.render as render
+from render.scheduler import RenderQueueFull, scheduler
 
 
 # Inititialization
@@ -40,10 +47,11 @@ load_dotenv()
 TOKEN = os.environ.get("token")
 intents = Intents.MESSAGE_CONTENT | Intents.GUILD_MESSAGES | Intents.GUILDS
 
-IS_UPDATED = update.run_updates()
 ROLE = "role"
 THEME = "theme"
-bot = Client(intents=intents, delete_unused_application_cmds=IS_UPDATED)
+# Set by main(), the render worker processes import this module without running it
+IS_UPDATED = False
+bot = None
 
 
 @slash_command(
@@ -65,11 +73,11 @@ async def request_list(ctx: SlashContext, request_type: str):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Business
-    request_str = business.list_requests(ctx.guild.id, request_type)
+    request_str = await business.list_requests(ctx.guild.id, request_type)
     paginator = Paginator.create_from_string(bot, request_str, page_size=1000)
     return await paginator.send(ctx)
 
@@ -121,11 +129,11 @@ async def complete_request(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     return await ctx.send(
-        business.award_request(
+        await business.award_request(
             ctx.guild.id,
             member.id,
             request_type=request_type,
@@ -165,10 +173,10 @@ async def complete_reward(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
-    res = business.give_reward(ctx.guild.id, member.id, ident)
+    res = await business.give_reward(ctx.guild.id, member.id, ident)
     return await ctx.send(res)
 
 
@@ -207,11 +215,11 @@ async def request_delete(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Business
-    dao.dao.request_delete(ctx.guild.id, request_type = request_type, 
+    await dao.async_dao.request_delete(ctx.guild.id, request_type = request_type, 
         request_name = request_name, effect = request_effect)
     # Respond
     return await ctx.send(
@@ -228,6 +236,17 @@ async def on_ready():
         logger.info("Update finished")
     else:
         logger.info("Bot up to date")
+    await asyncio.to_thread(render.clean_caches)
+    if not clean_caches.running:
+        clean_caches.start()
+
+
+@Task.create(IntervalTrigger(hours=1))
+async def clean_caches():
+    """Evicts old files from the render caches and logs their counters"""
+    await asyncio.to_thread(render.clean_caches)
+    logger.info("Render caches: %s", render.cache_stats())
+    logger.info("Render queue: %s", scheduler.stats())
 
 
 @listen()
@@ -238,7 +257,7 @@ async def on_message_create(ctx: MessageCreate):
     guild_error = tools.check_in_guild(message)
     if guild_error is not None:
         return
-    is_setup, db_guild = tools.check_guild_setup(message.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(message.guild.id)
     if not is_setup or db_guild[dao.guilds.SUBMISSION_CHANNEL] != message.channel.id:
         return
     images = tools.get_image_attachements(message)
@@ -355,7 +374,7 @@ async def setup(
     if info_channel.type != ChannelType.GUILD_TEXT:
         return await ctx.send("info_channel is not a text channel", ephemeral=True)
     # Setup in database
-    dao.dao.setup(
+    await dao.async_dao.setup(
         ctx.guild.id,
         ctx.guild.name,
         currency,
@@ -385,24 +404,25 @@ async def card(ctx: SlashContext, member: Member = None):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(
             db_guild
         )  # db_guild is a polymorph, either guild or error message
     if member is None:
         member = ctx.member
-    db_member = dao.dao.fetch_member(ctx.guild.id, member.id, member.display_name)
+    db_member = await dao.async_dao.fetch_member(ctx.guild.id, member.id, member.display_name)
 
     # Business
-    rank = dao.dao.get_rank(ctx.guild.id, member.id)
+    rank = await dao.async_dao.get_rank(ctx.guild.id, member.id)
     await ctx.defer()
-    image = await business.get_card_image(
-        db_member, db_guild, rank, pfp=member.display_avatar
-    )
-    res = await ctx.send(file=image)
-    render.clear_cache(image)
-    return res
+    try:
+        image = await business.get_card_image(
+            db_member, db_guild, rank, pfp=member.display_avatar
+        )
+    except RenderQueueFull:
+        return await ctx.send("Too many cards are being drawn right now, please try again shortly")
+    return await ctx.send(file=File(io.BytesIO(image), file_name=render.card_file_name()))
 
 
 @slash_command(
@@ -417,15 +437,15 @@ async def leaderboard(ctx: SlashContext):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(db_guild)
     # Business
-    db_leaderboard = dao.dao.get_leaderboard(ctx.guild.id)
-    request_embeds = tools.generate_leaderboard(
-        db_leaderboard, db_guild[dao.guilds.CURRENCY]
+    paginator = await LeaderboardPaginator.create(
+        bot, ctx.guild.id, db_guild[dao.guilds.CURRENCY]
     )
-    paginator = Paginator.create_from_embeds(bot, *request_embeds)
+    if paginator is None:
+        return await ctx.send("No members on the leaderboard yet")
     return await paginator.send(ctx)
 
 
@@ -447,14 +467,14 @@ async def cooldown_reset(ctx: SlashContext, member: Member = None):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(
             db_guild
         )  # db_guild is a polymorph, either guild or error message
     if member is None:
         member = ctx.member
-    dao.dao.cooldown_reset(ctx.guild.id, member.id)
+    await dao.async_dao.cooldown_reset(ctx.guild.id, member.id)
     return await ctx.send(f"Request cooldown for <@{member.id}> have been reset.")
 
 
@@ -499,11 +519,11 @@ async def request_add(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Update DB
-    res = business.add_request(ctx, request_type, request_name, request_effect, value)
+    res = await business.add_request(ctx, request_type, request_name, request_effect, value)
     # Respond
     return await ctx.send(res)
 
@@ -531,7 +551,7 @@ async def points_add(ctx: SlashContext, member: Member, points: int):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     await business.add_points_listener(ctx.guild, member.id, points)
@@ -561,7 +581,7 @@ async def points_sub(ctx: SlashContext, member: Member, points: int):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     await business.add_points_listener(ctx.guild, member.id, -points)
@@ -621,7 +641,7 @@ async def reward_add(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(db_guild)
     if ((role is None and nature is ROLE) or (points_required < 0 and condition != "given")):
@@ -658,7 +678,7 @@ async def reward_delete(ctx: SlashContext, ident: int):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # guild_id, ident, name, nature, role_id = None
@@ -677,10 +697,10 @@ async def reward_list(ctx: SlashContext):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
-    rewards_str = business.list_rewards(ctx.guild.id)
+    rewards_str = await business.list_rewards(ctx.guild.id)
     paginator = Paginator.create_from_string(bot, rewards_str, page_size=1000)
     return await paginator.send(ctx)
 
@@ -707,11 +727,11 @@ async def reward_completed(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Business
-    reward_attr_str = business.list_reward_completed(ctx.guild.id, member.id)
+    reward_attr_str = await business.list_reward_completed(ctx.guild.id, member.id)
     paginator = Paginator.create_from_string(bot, reward_attr_str, page_size=1000)
     return await paginator.send(ctx)
 
@@ -738,11 +758,11 @@ async def request_completed(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Business
-    request_attr_str = business.list_request_completed(ctx.guild.id, member.id)
+    request_attr_str = await business.list_request_completed(ctx.guild.id, member.id)
     paginator = Paginator.create_from_string(bot, request_attr_str, page_size=1000)
     return await paginator.send(ctx)
 
@@ -784,7 +804,7 @@ async def achievement_add(
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(db_guild)
     res = await business.add_achievement(ctx.guild.id, name, image, condition, description)
@@ -802,10 +822,10 @@ async def achievement_list(ctx: SlashContext):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
-    achievement_embeds = business.list_achievements(ctx.guild.id)
+    achievement_embeds = await business.list_achievements(ctx.guild.id)
     if len(achievement_embeds) < 1:
         return await ctx.send("No achievements yet!")
     channel = ctx.channel
@@ -828,12 +848,12 @@ async def generate_shop(ctx: SlashContext):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, db_guild = tools.check_guild_setup(ctx.guild.id)
+    is_setup, db_guild = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(db_guild)
 
     roles = ctx.guild.roles
-    res = business.generate_shop(db_guild, roles)
+    res = await business.generate_shop(db_guild, roles)
     channel = ctx.channel
     await ctx.defer(ephemeral=True)
     for kvp in res.items():
@@ -862,7 +882,7 @@ async def achievement_delete(ctx: SlashContext, achievement_name: str):
     guild_error = tools.check_in_guild(ctx)
     if guild_error is not None:
         return await ctx.send(guild_error)
-    is_setup, error = tools.check_guild_setup(ctx.guild.id)
+    is_setup, error = await tools.check_guild_setup(ctx.guild.id)
     if not is_setup:
         return await ctx.send(error)
     # Business
@@ -878,7 +898,7 @@ async def autocomplete_request_type(ctx: AutocompleteContext):
     if ctx.guild is None:
         return await ctx.send([])
     string_option_input = ctx.input_text  # can be empty/None
-    options = auto_complete.get_cache_request_options(ctx.guild.id)
+    options = await auto_complete.get_cache_request_options(ctx.guild.id)
     return await ctx.send(
         choices=auto_complete.autocomplete_from_options(options, string_option_input)
     )
@@ -891,7 +911,7 @@ async def autocomplete_request_name(ctx: AutocompleteContext):
         return await ctx.send([])
     string_option_input = ctx.input_text  # can be empty/None
     request_type = ctx.kwargs.get("request_type")
-    options = auto_complete.get_cache_request_options(
+    options = await auto_complete.get_cache_request_options(
         ctx.guild.id, request_type=request_type
     )
     return await ctx.send(
@@ -907,11 +927,37 @@ async def autocomplete_request_effect(ctx: AutocompleteContext):
     string_option_input = ctx.input_text  # can be empty/None
     request_type = ctx.kwargs.get("request_type")
     request_name = ctx.kwargs.get("request_name")
-    options = auto_complete.get_cache_request_options(
+    options = await auto_complete.get_cache_request_options(
         ctx.guild.id, request_type=request_type, name=request_name
     )
     return await ctx.send(
         choices=auto_complete.autocomplete_from_options(options, string_option_input)
     )
 
-bot.start(TOKEN)
+
+def main():
+    """Updates the database then starts the bot"""
+    # pylint:disable=W0603
+    global IS_UPDATED, bot
+    IS_UPDATED = update.run_updates()
+    bot = Client(intents=intents, delete_unused_application_cmds=IS_UPDATED)
+    try:
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_bot():
+    """Runs the bot until it stops, then closes the HTTP session of the renders
+    and the database connections"""
+    try:
+        await bot.astart(TOKEN)
+    finally:
+        await render.close_session()
+        await dao.async_dao.pool.close()
+
+
+# Render workers started with spawn import this module as __mp_main__,
+# nothing may run at import time
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 """Functions making up the most of the bot's algorithm"""
 
-import os
 from datetime import datetime
 import json
 import logging
 import psycopg
 from interactions.client.errors import BotException
-import dao.dao as dao
+import dao.async_dao as dao
 import dao.members as members
 import dao.guilds as guilds
 import dao.requests as requests
@@ -16,30 +15,31 @@ import dao.reward_attr as reward_attr
 import dao.achievements as achievements
 import dao.achievement_attr as achievement_attr
 import tools
+import sessions
 import render.render as render
+from render.scheduler import scheduler
 
 MAX_OPTIONS = 25
 
-eventDictionnary = {}
-
 
 # Business
 async def image_received(ctx, images):
     """A message with an image has been received"""
     guild = ctx.message.guild
     author = ctx.message.author
+    # Check input and fetch from database
+    guild_error = tools.check_in_guild(ctx.message)
+    if guild_error is not None:
+        return  # Nothing to do
+    is_setup, db_guild = await tools.check_guild_setup(guild.id)
+    if is_setup is False or ctx.message.channel.id != db_guild[guilds.SUBMISSION_CHANNEL]:
+        return  # Nothing to do
     user_ids = [author.id]
     async for user in ctx.message.mention_users:
         if user.id is not author.id:
             user_ids.append(user.id)
-    is_setup, db_guild = tools.check_guild_setup(guild.id)
-    is_right_channel = ctx.message.channel.id == db_guild[guilds.SUBMISSION_CHANNEL]
-    # Check input and fetch from database
-    guild_error = tools.check_in_guild(ctx.message)
-    if guild_error is not None or is_setup is False or is_right_channel is False:
-        return  # Nothing to do
     # Make sure that the member exists and update its nickname in the database
-    db_member = dao.fetch_member(guild.id, author.id, author.display_name)
+    db_member = await dao.fetch_member(guild.id, author.id, author.display_name)
     if (
         db_member[members.NEXT_SUBMISSION_TIME].year != datetime.min.year
     ):  # The user submitted before
@@ -49,10 +49,8 @@ async def image_received(ctx, images):
                 "You will be able to submit your next request on:"
                 f"<t:{int(timestamp_next_request)}>"
             )
-    image_string = ";".join(images)
-    eventDictionnary[f"image,{author.id},{ctx.message.id}"] = image_string
-    eventDictionnary[f"users,{author.id},{ctx.message.id}"] = user_ids
-    type_list = tools.request_per_column(guild.id)["type"]
+    await sessions.store.create(author.id, ctx.message.id, images, user_ids)
+    type_list = (await tools.request_per_column(guild.id))["type"]
     type_list = list(dict.fromkeys(type_list))  # Remove doubles
     if len(type_list) == 0:
         return await ctx.send("Please start by registering requests for this guild")
@@ -66,10 +64,10 @@ async def image_received(ctx, images):
 
 async def type_component(ctx, request_type, event_type, req_member, unique):
     """A component indicating the type of request that have been received"""
-    eventDictionnary[f"{event_type},{req_member},{unique}"] = request_type
-    name_list = tools.request_per_column(ctx.guild.id, request_type=request_type)[
-        "name"
-    ]
+    await sessions.store.update(req_member, unique, request_type=request_type)
+    name_list = (
+        await tools.request_per_column(ctx.guild.id, request_type=request_type)
+    )["name"]
     name_list = list(dict.fromkeys(name_list))  # Remove doubles
     if len(name_list) == 0:
         return await ctx.send(f"Could not find any {request_type}")
@@ -83,10 +81,16 @@ async def type_component(ctx, request_type, event_type, req_member, unique):
 
 async def name_component(ctx, name, event_type, req_member, unique):
     """A component indicating the name of request that have been received"""
-    request_type = eventDictionnary.get(f"type,{req_member},{unique}")
-    eventDictionnary[f"{event_type},{req_member},{unique}"] = name
-    effect_list = tools.request_per_column(
-        ctx.guild.id, request_type=request_type, name=name
+    submission = await sessions.store.get(req_member, unique)
+    if submission is None:
+        return await ctx.edit_origin(
+            content="Sorry, we lost track of your request... Please submit again",
+            components=[],
+        )
+    request_type = submission["type"]
+    await sessions.store.update(req_member, unique, name=name)
+    effect_list = (
+        await tools.request_per_column(ctx.guild.id, request_type=request_type, name=name)
     )["effect"]
     effect_list = list(dict.fromkeys(effect_list))  # Remove doubles
     if len(effect_list) == 0:
@@ -101,13 +105,13 @@ async def name_component(ctx, name, event_type, req_member, unique):
 
 async def effect_component(ctx, effect, event_type, req_member, unique):
     """A component indicating the effect of request that have been received"""
-    image_string = eventDictionnary.get(f"image,{req_member},{unique}")
-    request_type = eventDictionnary.get(f"type,{req_member},{unique}")
-    name = eventDictionnary.get(f"name,{req_member},{unique}")
+    submission = await sessions.store.get(req_member, unique)
 
-    if image_string is not None and request_type is not None and name is not None:
-        eventDictionnary[f"{event_type},{req_member},{unique}"] = effect
-        images = image_string.split(";")
+    if submission is not None and submission["type"] is not None and submission["name"] is not None:
+        await sessions.store.update(req_member, unique, effect=effect)
+        images = submission["images"]
+        request_type = submission["type"]
+        name = submission["name"]
         content = await send_to_review(ctx, images, request_type, name, effect, unique)
         return await ctx.edit_origin(
             content=content,
@@ -119,26 +123,24 @@ async def effect_component(ctx, effect, event_type, req_member, unique):
 
 async def accept_component(ctx, req_member, unique, value):
     """A component received when a user clicks the accept button"""
-    lock = eventDictionnary.get(f"lock,{req_member},{unique}")
-    if lock is True:
-        return await ctx.send(
-            content=("Someone else is already interacting"),
-            ephemeral=True
-        )
-    eventDictionnary[f"lock,{req_member},{unique}"] = True
-    image_string = eventDictionnary.get(f"image,{req_member},{unique}")
-    if image_string is None:
+    submission = await sessions.store.get(req_member, unique)
+    if submission is None:
         return await ctx.edit_origin(
             content=(
                 f"This request expired, please ask <@{req_member}> to submit it again"
             ),
             components=[],
         )
-    image_string = image_string.replace(";", "\n")
-    request_type = eventDictionnary.get(f"type,{req_member},{unique}")
-    name = eventDictionnary.get(f"name,{req_member},{unique}")
-    effect = eventDictionnary.get(f"effect,{req_member},{unique}")
-    users = eventDictionnary.get(f"users,{req_member},{unique}")
+    if not await sessions.store.lock(req_member, unique):
+        return await ctx.send(
+            content=("Someone else is already interacting"),
+            ephemeral=True
+        )
+    image_string = "\n".join(submission["images"])
+    request_type = submission["type"]
+    name = submission["name"]
+    effect = submission["effect"]
+    users = submission["users"]
     last_request = "I forgor 💀"
     if request_type is not None:
         last_request = f"{request_type} {name} {effect}"
@@ -146,14 +148,15 @@ async def accept_component(ctx, req_member, unique, value):
     member_pings = ""
     for user in users:
         await add_points_listener(ctx.guild, user, value)
-        dao.update_member_submission(ctx.guild.id, user, last_request)
-        award_res = award_request(
-            ctx.guild.id,
-            user,
-            request_type=request_type,
-            request_name=name,
-            request_effect=effect,
-        )
+        async with dao.unit_of_work():
+            await dao.update_member_submission(ctx.guild.id, user, last_request)
+            award_res = await award_request(
+                ctx.guild.id,
+                user,
+                request_type=request_type,
+                request_name=name,
+                request_effect=effect,
+            )
         # Send messages
         member_pings = member_pings + f"<@{user}> "
     await notify_member(ctx, member_pings, unique, value, fulfilled=True)
@@ -165,41 +168,40 @@ async def accept_component(ctx, req_member, unique, value):
         ),
         components=[],
     )
-    clear_events(unique, req_member)
+    await sessions.store.delete(req_member, unique)
     return res
 
 
 async def deny_component(ctx, req_member, unique, value):
     """A component received when a user clicks the deny button"""
-    lock = eventDictionnary.get(f"lock,{req_member},{unique}")
-    if lock is True:
+    submission = await sessions.store.get(req_member, unique)
+    if submission is None:
+        return await ctx.edit_origin(
+            content=(
+                f"This request expired, please ask <@{req_member}> to submit it again"
+            ),
+            components=[],
+        )
+    if not await sessions.store.lock(req_member, unique):
         return await ctx.send(
             content=("Someone else is already interacting"),
             ephemeral=True
         )
-    eventDictionnary[f"lock,{req_member},{unique}"] = True
     guild = ctx.guild.id
     member = ctx.member.id
-    db_member = dao.get_member(guild, member)
-    db_guild = dao.get_guild(guild)
     modal = tools.get_denial_reason_modal()
-    image_string = eventDictionnary.get(f"image,{req_member},{unique}")
     await ctx.send_modal(modal=modal)
-    if image_string is None:
-        return await ctx.edit_origin(
-            content=(
-                f"This request expired, please ask <@{req_member}> to submit it again"
-            ),
-            components=[],
-        )
-    image_string = image_string.replace(";", "\n")
+    image_string = "\n".join(submission["images"])
     # Response received
     modal_ctx = await ctx.bot.wait_for_modal(modal)
     paragraph = modal_ctx.responses["reason"]
-    next_submission_time = tools.calculate_prev_submission_time(
-        db_member[members.NEXT_SUBMISSION_TIME], db_guild[guilds.COOLDOWN]
-    )
-    dao.update_cooldown(guild, member, next_submission_time)
+    async with dao.unit_of_work():
+        db_member = await dao.get_member(guild, member)
+        db_guild = await dao.get_guild(guild)
+        next_submission_time = tools.calculate_prev_submission_time(
+            db_member[members.NEXT_SUBMISSION_TIME], db_guild[guilds.COOLDOWN]
+        )
+        await dao.update_cooldown(guild, member, next_submission_time)
     await notify_member(
         ctx, f"<@{req_member}>", unique, value, reason=paragraph, fulfilled=False
     )
@@ -211,23 +213,22 @@ async def deny_component(ctx, req_member, unique, value):
         ),
         components=[],
     )
-    clear_events(unique, req_member)
+    await sessions.store.delete(req_member, unique)
     return res
 
 
 async def buy_component(ctx, nature, ident, cost):
     """A component received when a member tries to buy a reward"""
-    db_member = dao.fetch_member(ctx.guild.id, ctx.author.id, ctx.author.display_name)
-    balance = db_member[members.POINTS] - db_member[members.SPENT]
-    if balance >= cost:
+    async with dao.unit_of_work():  # The reward and its cost are committed together
+        db_member = await dao.fetch_member(ctx.guild.id, ctx.author.id, ctx.author.display_name)
+        balance = db_member[members.POINTS] - db_member[members.SPENT]
+        if balance < cost:
+            return f"Not enough funds, cost: {cost} balance: {balance}"
         content, error = await award_reward(ctx, ident) #KO
         if error:
             return content
-        dao.add_spent(ctx.guild.id, ctx.author.id, cost)
-        content = await toggle_component(ctx, nature, ident=ident)
-    else:
-        content = f"Not enough funds, cost: {cost} balance: {balance}"
-    return content
+        await dao.add_spent(ctx.guild.id, ctx.author.id, cost)
+    return await toggle_component(ctx, nature, ident=ident)
 
 
 async def toggle_component(ctx, nature, ident):
@@ -245,13 +246,14 @@ async def send_to_review(ctx, images, request_type, name, effect, unique):
     """Send a request to be reviewed"""
     guild = ctx.guild.id
     member = ctx.author.id
-    db_member = dao.get_member(guild, member)
-    db_guild = dao.get_guild(guild)
-    next_submission_time = tools.calculate_next_submission_time(
-        db_member[members.NEXT_SUBMISSION_TIME], db_guild[guilds.COOLDOWN]
-    )
-    dao.update_cooldown(guild, member, next_submission_time)
-    db_request = dao.get_request(guild, request_type, name, effect)
+    async with dao.unit_of_work():
+        db_member = await dao.get_member(guild, member)
+        db_guild = await dao.get_guild(guild)
+        next_submission_time = tools.calculate_next_submission_time(
+            db_member[members.NEXT_SUBMISSION_TIME], db_guild[guilds.COOLDOWN]
+        )
+        await dao.update_cooldown(guild, member, next_submission_time)
+        db_request = await dao.get_request(guild, request_type, name, effect)
     if len(db_guild) == 0:
         return "Please setup the guild again"
     if db_request is None or len(db_request) == 0:
@@ -295,7 +297,7 @@ async def notify_member(
     ctx, member_pings, message, points, reason=None, fulfilled=False
 ):
     """Notify members of the result of their request"""
-    db_guild = dao.get_guild(ctx.guild.id)
+    db_guild = await dao.get_guild(ctx.guild.id)
     channel = await ctx.guild.fetch_channel(db_guild[guilds.SUBMISSION_CHANNEL])
     message = await channel.fetch_message(message)
     if fulfilled:
@@ -310,21 +312,9 @@ async def notify_member(
     return await message.reply(f"{member_pings} {content}")
 
 
-def clear_events(unique, member):
-    """Delete the event from the event dictionnary"""
-    try:
-        del eventDictionnary[f"type,{unique},{member}"]
-        del eventDictionnary[f"name,{unique},{member}"]
-        del eventDictionnary[f"effect,{unique},{member}"]
-        del eventDictionnary[f"image,{unique},{member}"]
-        del eventDictionnary[f"lock,{unique},{member}"]
-    except KeyError:
-        logging.info("Unable to delete event from the dictionnary")
-
-
-def add_request(ctx, req_type, name, effect, value):
+async def add_request(ctx, req_type, name, effect, value):
     """Add a new request to the database"""
-    req = tools.ordered_requests(ctx.guild.id)
+    req = await tools.ordered_requests(ctx.guild.id)
     if req is not None:
         if len(req) >= MAX_OPTIONS:
             return (
@@ -345,7 +335,7 @@ def add_request(ctx, req_type, name, effect, value):
                     f" {MAX_OPTIONS} effects for {name}"
                 )
     try:
-        dao.request_register(ctx.guild.id, req_type, name, effect, value)
+        await dao.request_register(ctx.guild.id, req_type, name, effect, value)
     except psycopg.Error as e:
         logging.error(e)
         return (
@@ -374,7 +364,7 @@ async def add_reward(
             error = render.check_theme_exist(name)
             if error:
                 return await ctx.send(error)
-        dao.insert_reward(ctx.guild.id, name, condition, nature, role_id, points_required)
+        await dao.insert_reward(ctx.guild.id, name, condition, nature, role_id, points_required)
     except psycopg.Error as e:
         logging.error(e)
         return await ctx.send(
@@ -391,16 +381,16 @@ async def add_reward(
 async def delete_reward(guild_id, ident):
     """Removes a reward"""
     try:
-        dao.delete_reward(guild_id, list_ident = [ident])
+        await dao.delete_reward(guild_id, list_ident = [ident])
     except psycopg.Error as e:
         logging.error(e)
         return f"Could not delete this reward. {e}"
     return f"{ident} removed"
 
 
-def list_rewards(guild_id):
+async def list_rewards(guild_id):
     """Make a string of all the rewards"""
-    db_rewards = dao.get_rewards(guild_id)
+    db_rewards = await dao.get_rewards(guild_id)
     rewards_str = "\n".join(
         f"{rew[rewards.IDENT]};"
         f"{rew[rewards.NAME]};"
@@ -413,11 +403,11 @@ def list_rewards(guild_id):
     return "Id ;Name; Nature ;Condition ;Role ;Points\n" f"{rewards_str}"
 
 
-def list_reward_completed(guild_id, member_id):
+async def list_reward_completed(guild_id, member_id):
     """Lists all the rewards a user have completed"""
-    db_reward_attr = dao.get_reward_attribution(guild_id, member_id)
+    db_reward_attr = await dao.get_reward_attribution(guild_id, member_id)
     list_ident = [int(row[reward_attr.REWARD]) for row in db_reward_attr]
-    db_rewards = dao.get_rewards(guild_id, list_ident=list_ident)
+    db_rewards = await dao.get_rewards(guild_id, list_ident=list_ident)
     rewards_str = "\n".join(
         f"{rew[rewards.IDENT]};"
         f"{rew[rewards.NAME]};"
@@ -430,9 +420,9 @@ def list_reward_completed(guild_id, member_id):
     return "Id; Name; Nature ;Condition ;Role ;Points\n" f"{rewards_str}"
 
 
-def list_requests(guild_id, request_type):
+async def list_requests(guild_id, request_type):
     """Make a string of all the requests"""
-    db_requests = dao.get_requests(guild_id, request_type=request_type)
+    db_requests = await dao.get_requests(guild_id, request_type=request_type)
     requests_str = "\n".join(
         f"{req[rewards.IDENT]};"
         f"{req[requests.REQUEST_NAME]};"
@@ -443,11 +433,11 @@ def list_requests(guild_id, request_type):
     return "Id ;Name; Effect ;Value ;Points\n" f"{requests_str}"
 
 
-def list_request_completed(guild_id, member_id):
+async def list_request_completed(guild_id, member_id):
     """Make a string of all the requests that a member completed"""
-    db_request_attr = dao.get_request_attribution(guild_id, member_id)
+    db_request_attr = await dao.get_request_attribution(guild_id, member_id)
     list_ident = [int(row[request_attr.REQUEST]) for row in db_request_attr]
-    db_requests = dao.get_requests(guild_id, list_ident=list_ident)
+    db_requests = await dao.get_requests(guild_id, list_ident=list_ident)
     requests_str = "\n".join(
         f"{req[rewards.IDENT]};"
         f"{req[requests.REQUEST_NAME]};"
@@ -462,30 +452,28 @@ def list_request_completed(guild_id, member_id):
     )
 
 
-def award_request(
+async def award_request(
     guild_id, member_id, ident = None, request_type=None, request_name=None, request_effect=None
 ):
     """award a request to a user"""
     list_ident = None
     if ident is not None:
         list_ident = [ident]
-    db_requests = dao.get_requests(
+    db_requests = await dao.get_requests(
         guild_id, list_ident = list_ident, request_type=request_type, name=request_name, effect=request_effect
     )
     if len(db_requests) == 0:
         return "It seems that the request no longer exists in the database"
     db_request = db_requests[0]
     ident = db_request[requests.IDENT]
-    try:
-        dao.award_request(guild_id, member_id, ident)
-    except psycopg.Error:
-        pass
+    # Awarding a request twice is a no-op, the insert ignores conflicts
+    await dao.award_request(guild_id, member_id, ident)
     return f"<@{member_id}> is considered as having completed request {ident}"
 
 
 async def update_rewards(guild_id, member, current_points):
     """Update the rewards a member deserves"""
-    db_rewards = dao.get_rewards(guild_id)
+    db_rewards = await dao.get_rewards(guild_id)
     for reward in db_rewards:
         if (
             reward[rewards.CONDITION] == "milestone"
@@ -500,27 +488,27 @@ async def update_rewards(guild_id, member, current_points):
 
 async def add_points_listener(guild_ctx, member_id, value):
     """Business related to adding points"""
-    db_member = dao.get_member(guild_ctx.id, member_id)
     member = await guild_ctx.fetch_member(member_id)
-    db_member = dao.fetch_member(guild_ctx.id, member_id, member.display_name)
-    dao.add_points(guild_ctx.id, db_member[members.ID], value)
+    async with dao.unit_of_work():
+        db_member = await dao.fetch_member(guild_ctx.id, member_id, member.display_name)
+        await dao.add_points(guild_ctx.id, db_member[members.ID], value)
     await update_rewards(guild_ctx.id, member, db_member[members.POINTS] + value)
 
 
-def generate_shop(db_guild, roles):
+async def generate_shop(db_guild, roles):
     """Generate all the components to send to make the shop"""
     # Makes new shop
-    guild_rewards = dao.get_rewards(db_guild[guilds.ID], condition="bought")
+    guild_rewards = await dao.get_rewards(db_guild[guilds.ID], condition="bought")
     return tools.generate_shop_items(db_guild, guild_rewards, roles)
 
 
-def give_reward(guild_id, member_id, ident):
+async def give_reward(guild_id, member_id, ident):
     """give a reward to a member"""
-    db_reward = dao.get_rewards(guild_id, list_ident=[ident])
+    db_reward = await dao.get_rewards(guild_id, list_ident=[ident])
     if len(db_reward) == 0:
         return f"No reward with ident {ident}"
     try:
-        dao.award_reward(guild_id, member_id, ident)
+        await dao.award_reward(guild_id, member_id, ident)
     except psycopg.Error as e:
         print(e)
         return "Error adding reward"
@@ -533,13 +521,13 @@ async def award_reward(ctx, ident):
     error = False
     guild_id = ctx.guild.id
     member_id = ctx.author.id
-    db_award_attr = dao.get_reward_attribution(guild_id, member_id, ident)
+    db_award_attr = await dao.get_reward_attribution(guild_id, member_id, ident)
     if len(db_award_attr) > 0:
         error = True
         content = "Couldn't give this award, you already have it"
         return [content, error]
-    dao.award_reward(guild_id, member_id, ident)
-    db_rewards = dao.get_rewards(guild_id, list_ident=[ident])
+    await dao.award_reward(guild_id, member_id, ident)
+    db_rewards = await dao.get_rewards(guild_id, list_ident=[ident])
     if len(db_rewards) < 1:
         error = True
         content = f"Reward number {ident} doesn't exist anymore, ask an admin for help"
@@ -552,12 +540,12 @@ async def toggle_role_reward(ctx, ident):
     content = None
     guild_id = ctx.guild.id
     user = ctx.author
-    db_rewards = dao.get_rewards(guild_id, nature="role", list_ident=[ident])
+    db_rewards = await dao.get_rewards(guild_id, nature="role", list_ident=[ident])
     if len(db_rewards) == 0:
         return "This role can't be obtained anymore"
     db_reward = db_rewards[0]
     role_id = db_reward[dao.rewards.ROLE]
-    db_award_attr = dao.get_reward_attribution(
+    db_award_attr = await dao.get_reward_attribution(
         guild_id, user.id, ident
     )
     if len(db_award_attr) == 0:
@@ -577,23 +565,23 @@ async def toggle_theme_reward(ctx, ident):
     guild_id = ctx.guild.id
     user = ctx.author
     user_id = user.id
-    db_rewards = dao.get_rewards(guild_id, nature="theme", list_ident=[ident])
+    db_rewards = await dao.get_rewards(guild_id, nature="theme", list_ident=[ident])
     if len(db_rewards) == 0:
         return "This theme can't be obtained anymore"
     db_reward = db_rewards[0]
     name = db_reward[dao.rewards.NAME]
     theme_id = db_reward[dao.rewards.IDENT]
-    db_award_attr = dao.get_reward_attribution(
+    db_award_attr = await dao.get_reward_attribution(
         guild_id, user.id, ident
     )
     if len(db_award_attr) == 0:
         return "You haven't earned this reward yet"
-    db_member = dao.get_member(guild_id, user_id)
+    db_member = await dao.get_member(guild_id, user_id)
     theme = db_member[members.THEME]
     if theme == theme_id:
         content = f"Theme {name} was already applied"
     else:
-        dao.set_theme(guild_id, user_id, theme_id)
+        await dao.set_theme(guild_id, user_id, theme_id)
         content = f"Theme {name} activated"
     return content
 
@@ -628,16 +616,20 @@ def conditions_fulfilled(db_member, db_req_attr, db_rew_attr, conditions):
     return obtained
 
 
-def update_achievements(guild_id, member_id):
+async def update_achievements(guild_id, member_id):
     """Adds all the missing achievements to the user if obtained"""
     res = ""
-    db_achievements = dao.select_achievements(guild_id)
-    db_member = dao.get_member(guild_id, member_id)
-    db_req_attr = dao.get_request_attribution(guild_id, member_id)
-    db_rew_attr = dao.get_reward_attribution(guild_id, member_id)
-    db_requests = dao.get_requests(guild_id)
-    db_rewards = dao.get_rewards(guild_id)
+    db_achievements = await dao.select_achievements(guild_id)
+    db_member = await dao.get_member(guild_id, member_id)
+    db_ach_attr = await dao.select_achievement_attr(guild_id, member_id)
+    obtained = [attr[achievement_attr.ACHIEVEMENT] for attr in db_ach_attr]
+    db_req_attr = await dao.get_request_attribution(guild_id, member_id)
+    db_rew_attr = await dao.get_reward_attribution(guild_id, member_id)
+    db_requests = await dao.get_requests(guild_id)
+    db_rewards = await dao.get_rewards(guild_id)
     for achievement in db_achievements:
+        if achievement[achievements.IDENT] in obtained:
+            continue
         is_parsed, conditions = tools.parse_condition(achievement[achievements.CONDITION])
         if not is_parsed:
             res = f"{res}Can't parse condition for achievement {achievement[achievements.NAME]}\n"
@@ -645,18 +637,15 @@ def update_achievements(guild_id, member_id):
         requests_lst, rewards_lst, points = conditions
         missing_req, missing_rew = missing_condition(requests_lst, rewards_lst, db_requests, db_rewards)
         if len(missing_req) > 0 or len(missing_rew) > 0:
-            dao.request_delete(guild_id, ident=missing_req)
-            dao.delete_reward(guild_id, list_ident=missing_rew)
+            await dao.request_delete(guild_id, list_ident=missing_req)
+            await dao.delete_reward(guild_id, list_ident=missing_rew)
             res = (f"{res}Missing requests {missing_req} and rewards {missing_rew} from database\n"
                 f"Achievement {achievement[achievements.NAME]} ignored, please delete it\n")
             continue
         if conditions_fulfilled(db_member, db_req_attr, db_rew_attr, conditions):
             # Achievement has been obtained
-            try:
-                dao.award_achievement(guild_id, member_id, achievement[achievements.IDENT])
-                res = f"{res}Added achievement {achievement[achievements.NAME]}\n"
-            except psycopg.Error:
-                continue
+            await dao.award_achievement(guild_id, member_id, achievement[achievements.IDENT])
+            res = f"{res}Added achievement {achievement[achievements.NAME]}\n"
     return res
 
 
@@ -703,8 +692,8 @@ async def add_achievement(guild_id, name, image, condition, description):
     if image.content_type.startswith("image") is False:
         return ("Incorrect attachement for image. Please provide a proper image."
             "Animated GIFs are not supported. Recommanded size is 48*48.")
-    db_requests = dao.get_requests(guild_id, list_ident=requests_lst)
-    db_rewards = dao.get_rewards(guild_id, list_ident=rewards_lst)
+    db_requests = await dao.get_requests(guild_id, list_ident=requests_lst)
+    db_rewards = await dao.get_rewards(guild_id, list_ident=rewards_lst)
     missing_req = tools.missing_ident(requests_lst, db_requests, dao.requests.IDENT)
     missing_rew = tools.missing_ident(rewards_lst, db_rewards, dao.rewards.IDENT)
     if len(missing_req) > 0 or len(missing_rew) > 0:
@@ -712,7 +701,7 @@ async def add_achievement(guild_id, name, image, condition, description):
             f"Requests {missing_req}, Rewards {missing_rew}")
     json_condition = json.dumps({"requests":requests_lst, "rewards":rewards_lst, "points":points})
     try:
-        dao.insert_achievement(guild_id, name, icon, json_condition, description)
+        await dao.insert_achievement(guild_id, name, icon, json_condition, description)
     except psycopg.Error as e:
         logging.error(e)
         return (
@@ -720,14 +709,14 @@ async def add_achievement(guild_id, name, image, condition, description):
         )
     return f"Achievement {name} added"
 
-def list_achievements(guild_id):
+async def list_achievements(guild_id):
     """Make a string of all the achievements"""
-    db_achievements = dao.select_achievements(guild_id)
+    db_achievements = await dao.select_achievements(guild_id)
     return tools.generate_achievements(db_achievements)
 
 
 async def get_card_image(db_member, db_guild, rank, pfp=None):
-    """Get the rendered image of a user's guild card"""
+    """Get the image bytes of a user's guild card"""
     res = ""
     currency = db_guild[guilds.CURRENCY]
     guild_id = db_member[members.GUILD]
@@ -737,11 +726,12 @@ async def get_card_image(db_member, db_guild, rank, pfp=None):
     balance = points - db_member[members.SPENT]
     next_sub_t = db_member[members.NEXT_SUBMISSION_TIME]
     theme_id = db_member[members.THEME]
-    # Update the user's achievements
-    res = f"{res}\n{update_achievements(guild_id, member_id)}"
-    db_achievements = dao.select_achievements(guild_id)
-    db_achievement_attr = dao.select_achievement_attr(guild_id, member_id)
-    db_theme = dao.get_rewards(guild_id, list_ident=[theme_id])
+    async with dao.unit_of_work():
+        # Update the user's achievements
+        res = f"{res}\n{await update_achievements(guild_id, member_id)}"
+        db_achievements = await dao.select_achievements(guild_id)
+        db_achievement_attr = await dao.select_achievement_attr(guild_id, member_id)
+        db_theme = await dao.get_rewards(guild_id, list_ident=[theme_id])
     theme_name = "NONE"
     if (db_theme and len(db_theme) > 0):
         theme_name = db_theme[0][rewards.NAME]
@@ -752,10 +742,7 @@ async def get_card_image(db_member, db_guild, rank, pfp=None):
                 icon_achievements.append(ach[achievements.ICON])
                 break
     # last_sub = db_member[dao.members.LAST_SUBMISSION]
-    png = os.path.abspath(f"render/{guild_id}_{member_id}_card.png")
-    # Replaces image if exists
-    # render.clear_cache(png)
-    images = await render.cache_images(guild_id, member_id, pfp_url=pfp)
+    images = await render.cache_images(pfp_url=pfp)
 
     if next_sub_t.year is datetime.min.year:
         next_req_str = "No submission yet"
@@ -765,26 +752,25 @@ async def get_card_image(db_member, db_guild, rank, pfp=None):
             next_req_str = "You can submit now"
         else:
             next_req_str = f"Submit in: {tools.human_readable_delta(delta)}"
-    render.generate_guild_card(
-        png,
+    job = render.card_job(
         member_id,
         nick,
         currency,
         balance,
         points,
         rank,
-        theme = render.load_theme(theme_name),
+        theme_name,
         pfp=images.get("pfp"),
-        achievements=icon_achievements,
+        achievements=[bytes(icon) for icon in icon_achievements],
         next_req_str=next_req_str,
     )
-    return png
+    return await scheduler.render(guild_id, member_id, job)
 
 
 async def delete_achievement(guild_id, a_name):
     """Removes an achievement"""
     try:
-        dao.achievement_delete(guild_id, a_name)
+        await dao.achievement_delete(guild_id, a_name)
     except psycopg.Error as e:
         logging.error(e)
         return f"Could not delete this achievement. {e}"
@@ -7,13 +7,14 @@ ACHIEVEMENT = 2
 def insert(cursor, guild, member, achievement):
     """Insert an element in the database"""
     cursor.execute(f"INSERT INTO {TABLE_NAME} (guild, member, achievement)"
-        " values(%s, %s, %s)",
+        " values(%s, %s, %s)"
+        " ON CONFLICT DO NOTHING",
         [guild, member, achievement])
 
 def select(cursor, guild, member = None, achievement = None):
     """Select constructed depending on the parameters that's given to it"""
     req = (f"SELECT guild, member, achievement FROM {TABLE_NAME}"
-        " where guild=%s")
+        " where guild=%s ")
     parm = []
     if member is not None:
         req = f"{req}AND member=%s "
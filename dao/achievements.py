@@ -17,7 +17,7 @@ def insert(cursor, guild_id, a_name, icon, condition, description):
 def select(cursor, guild, ident = None, a_name = None, icon = None, condition = None, description = None):
     """Select constructed depending on the parameters that's given to it"""
     req = (f"SELECT guild, ident, a_name, icon, condition, description FROM {TABLE_NAME}"
-        " where guild=%s")
+        " where guild=%s ")
     parm = []
     parm.insert(0, guild)
     if ident is not None:
@@ -0,0 +1,417 @@
+"""Asynchronous entry point for database requests, used by the bot's coroutines"""
+
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from psycopg_pool import AsyncConnectionPool
+import dao.guilds as guilds
+import dao.members as members
+import dao.requests as requests
+import dao.rewards as rewards
+import dao.achievements as achievements
+import dao.reward_attr as reward_attr
+import dao.request_attr as request_attr
+import dao.achievement_attr as achievement_attr
+import dao.submissions as submissions
+from dao.dao import (
+    rank_window,
+    connection_string,
+    POOL_MIN_SIZE,
+    POOL_MAX_SIZE,
+    POOL_MAX_IDLE,
+    POOL_MAX_LIFETIME,
+    POOL_TIMEOUT,
+)
+
+# The async pool can only be opened from a running event loop, see connect()
+pool = AsyncConnectionPool(
+    connection_string,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    max_idle=POOL_MAX_IDLE,
+    max_lifetime=POOL_MAX_LIFETIME,
+    timeout=POOL_TIMEOUT,
+    check=AsyncConnectionPool.check_connection,
+    open=False,
+)
+
+# Connection of the unit of work running in the current task, if any
+current_connection = ContextVar("current_connection", default=None)
+
+# Guild configurations by guild id, read on every message so they are kept in memory.
+# Entries are [datetime cached, db_guild or None if the guild isn't setup]
+GUILD_STALE_IN = float(os.environ.get("guild_cache_duration") or "300")
+guild_cache = {}
+# guild: [datetime, number of members], kept as long as the guild configuration
+member_count_cache = {}
+
+
+class Statement:
+    """Stands in for a cursor to record the statement issued by a table function"""
+
+    def __init__(self):
+        self.query = None
+        self.params = None
+        self.fetch = None
+
+    def execute(self, query, params=None):
+        """Record the query instead of running it"""
+        self.query = query
+        self.params = params
+
+    def fetchone(self):
+        """Record that a single row is expected"""
+        self.fetch = "one"
+
+    def fetchall(self):
+        """Record that every row is expected"""
+        self.fetch = "all"
+
+
+async def run(cursor, table_function, *args, **kwargs):
+    """Run a table function (ex: members.select) on an async cursor.
+    Table functions issue one statement then fetch, so the SQL is written only once"""
+    statement = Statement()
+    table_function(statement, *args, **kwargs)
+    await cursor.execute(statement.query, statement.params)
+    if statement.fetch == "one":
+        return await cursor.fetchone()
+    if statement.fetch == "all":
+        return await cursor.fetchall()
+    return None
+
+
+@asynccontextmanager
+async def connect():
+    """Borrow a cursor from the pool, the transaction is committed on exit.
+    Inside a unit of work the cursor comes from the unit's connection instead"""
+    connection = current_connection.get()
+    if connection is not None:
+        async with connection.cursor() as cursor:
+            yield cursor
+        return
+    if pool.closed:
+        await pool.open()
+    async with pool.connection() as connection:
+        async with connection.cursor() as cursor:
+            yield cursor
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """Every dao call made inside this block shares one connection and one transaction,
+    committed once when the block exits or rolled back if it raises.
+    Avoid awaiting discord inside the block, the connection is held until it ends"""
+    if current_connection.get() is not None:  # Nested, join the current unit of work
+        yield
+        return
+    if pool.closed:
+        await pool.open()
+    async with pool.connection() as connection:
+        token = current_connection.set(connection)
+        try:
+            yield
+        finally:
+            current_connection.reset(token)
+
+
+async def setup(
+    guild_id: int,
+    guild_name: int,
+    currency: str,
+    submission_channel: int,
+    review_channel: int,
+    info_channel: int,
+    cooldown: int,
+):
+    async with connect() as cursor:
+        if await guild_exists(cursor, guild_id):
+            res = await run(
+                cursor,
+                guilds.update,
+                guild_id,
+                guild_name,
+                currency,
+                submission_channel,
+                review_channel,
+                info_channel,
+                cooldown,
+            )
+        else:
+            res = await run(
+                cursor,
+                guilds.insert,
+                guild_id,
+                guild_name,
+                currency,
+                submission_channel,
+                review_channel,
+                info_channel,
+                None,
+                cooldown,
+            )
+    # After the commit, so a concurrent read can't cache the previous configuration
+    invalidate_guild(guild_id)
+    return res
+
+
+async def get_guild(guild_id: int):
+    """Guild configuration, read through the guild cache"""
+    cache = guild_cache.get(guild_id)
+    if cache is not None and cache[0].timestamp() + GUILD_STALE_IN >= datetime.now().timestamp():
+        return cache[1]
+    async with connect() as cursor:
+        db_guild = await run(cursor, guilds.select, guild_id)
+    guild_cache[guild_id] = [datetime.now(), db_guild]
+    return db_guild
+
+
+def invalidate_guild(guild_id: int):
+    """Forget the cached configuration of a guild"""
+    guild_cache.pop(guild_id, None)
+
+
+async def get_rank(guild_id: int, member_id: int):
+    async with connect() as cursor:
+        return (await run(cursor, members.rank_of, guild_id, member_id))[0]
+
+
+async def get_rank_window(guild_id: int, member_id: int, size: int = 2):
+    """Rows of rank, id, nickname, points for the member and up to size members on each side"""
+    async with connect() as cursor:
+        db_member = await run(cursor, members.select, guild_id, member_id)
+        if db_member is None:
+            return []
+        rank = (await run(cursor, members.rank_of, guild_id, member_id))[0]
+        points = db_member[members.POINTS]
+        above = await run(cursor, members.ranked_above, guild_id, member_id, points, size)
+        below = await run(cursor, members.ranked_below, guild_id, member_id, points, size)
+    return rank_window(rank, db_member, above, below)
+
+
+async def count_members(guild_id: int):
+    """Number of members of a guild, read through the member count cache.
+    Members are never removed, a cached count only misses the ones who joined since"""
+    cache = member_count_cache.get(guild_id)
+    if cache is not None and cache[0].timestamp() + GUILD_STALE_IN >= datetime.now().timestamp():
+        return cache[1]
+    async with connect() as cursor:
+        total = (await run(cursor, members.count, guild_id))[0]
+    # An empty guild isn't cached, its first members would wait for the count to expire
+    if total > 0:
+        member_count_cache[guild_id] = [datetime.now(), total]
+    return total
+
+
+async def get_leaderboard_page(guild_id: int, limit: int, after=None, before=None, from_end=False):
+    """Rows of id, nickname, points in rank order, one page at a time.
+    after and before are the (points, id) of the row preceding or following the page,
+    from_end gets the last page. Otherwise the page starts at the top of the leaderboard"""
+    async with connect() as cursor:
+        if after is not None:
+            return await run(cursor, members.ranked_below, guild_id, after[1], after[0], limit)
+        if before is not None:
+            return (await run(cursor, members.ranked_above, guild_id, before[1], before[0], limit))[::-1]
+        if from_end:
+            return (await run(cursor, members.bottom, guild_id, limit))[::-1]
+        return await run(cursor, members.top, guild_id, limit)
+
+
+async def fetch_member(guild_id: int, member_id: int, nickname: str):
+    """Refreshes and return db member"""
+    async with connect() as cursor:
+        return await refresh_and_get_member(cursor, guild_id, member_id, nickname)
+
+
+async def get_member(guild_id: int, member_id: int):
+    async with connect() as cursor:
+        return await run(cursor, members.select, guild_id, member_id)
+
+
+async def update_member_submission(guild_id: int, member_id: int, last_submission: str):
+    async with connect() as cursor:
+        return await run(
+            cursor, members.update_submission, guild_id, member_id, last_submission
+        )
+
+
+async def update_cooldown(guild_id: int, member_id: int, next_submission_time: datetime):
+    async with connect() as cursor:
+        return await run(
+            cursor, members.set_cooldown, guild_id, member_id, next_submission_time
+        )
+
+
+async def cooldown_reset(guild_id: int, member_id: int):
+    async with connect() as cursor:
+        return await run(cursor, members.reset_cooldown, guild_id, member_id)
+
+
+async def request_register(guild_id, request_type, name, effect, value):
+    async with connect() as cursor:
+        return await run(cursor, requests.insert, guild_id, request_type, name, effect, value)
+
+
+async def request_delete(guild_id, ident = None, request_type = None, request_name = None, effect = None, list_ident = None):
+    async with connect() as cursor:
+        return await run(cursor, requests.delete, guild_id, ident, request_type, request_name, effect, list_ident)
+
+
+async def get_request(guild_id, request_type, name, effect):
+    async with connect() as cursor:
+        return await run(cursor, requests.selectOne, guild_id, request_type, name, effect)
+
+
+async def get_requests(guild_id, request_type=None, name=None, effect=None, list_ident=None):
+    async with connect() as cursor:
+        return await run(
+            cursor,
+            requests.select,
+            guild_id,
+            request_type=request_type,
+            request_name=name,
+            effect=effect,
+            list_ident=list_ident,
+        )
+
+
+async def add_points(guild_id, member_id, points):
+    async with connect() as cursor:
+        return await run(cursor, members.add_points, guild_id, member_id, points)
+
+
+async def add_spent(guild_id, member_id, points):
+    async with connect() as cursor:
+        return await run(cursor, members.add_spent, guild_id, member_id, points)
+
+
+async def set_theme(guild_id, member_id, theme):
+    async with connect() as cursor:
+        return await run(cursor, members.set_theme, guild_id, member_id, theme)
+
+
+async def guild_exists(cursor, guild_id):
+    """True if the guild exists in the database"""
+    return await run(cursor, guilds.select, guild_id) is not None
+
+
+async def refresh_and_get_member(cursor, guild_id, member_id, nickname):
+    """Create member if it doesn't exist, update its nickname then gets it"""
+    db_member = await run(cursor, members.upsert, guild_id, member_id, nickname, datetime.min)
+    if db_member is None:  # Inserted concurrently after the statement started
+        db_member = await run(cursor, members.select, guild_id, member_id)
+    return db_member
+
+
+async def insert_reward(guild_id, name, condition, nature, reward_id, points_required):
+    """Insert a reward in the database"""
+    async with connect() as cursor:
+        return await run(
+            cursor, rewards.insert, guild_id, name, condition, nature, reward_id, points_required
+        )
+
+
+async def delete_reward(guild_id, list_ident=None, name=None, condition=None, nature=None, reward_id=None):
+    """Delete a reward in the database"""
+    async with connect() as cursor:
+        return await run(cursor, rewards.delete, guild_id, list_ident, name, condition, nature, reward_id)
+
+
+async def get_rewards(guild_id, list_ident=None, name=None, condition=None, nature=None, reward_id=None):
+    """Selects a reward in the database"""
+    async with connect() as cursor:
+        return await run(cursor, rewards.select, guild_id, list_ident, name, condition, nature, reward_id)
+
+
+async def award_reward(guild_id, user_id, reward):
+    """Links a reward to a user"""
+    async with connect() as cursor:
+        return await run(cursor, reward_attr.insert, guild_id, user_id, reward)
+
+
+async def deny_reward(guild_id, user_id, reward):
+    """Unlinks a reward to a user"""
+    async with connect() as cursor:
+        return await run(cursor, reward_attr.delete, guild_id, user_id, reward)
+
+
+async def get_reward_attribution(guild_id, user_id, ident = None):
+    """Selects award attributions"""
+    async with connect() as cursor:
+        return await run(cursor, reward_attr.select, guild_id, user_id, ident)
+
+
+async def award_request(guild_id, user_id, request):
+    """Links a request to a user"""
+    async with connect() as cursor:
+        return await run(cursor, request_attr.insert, guild_id, user_id, request)
+
+
+async def deny_request(guild_id, user_id, request):
+    """Unlinks a request to a user"""
+    async with connect() as cursor:
+        return await run(cursor, request_attr.delete, guild_id, user_id, request)
+
+
+async def get_request_attribution(guild_id, member_id, ident = None):
+    """Gets request attributions"""
+    async with connect() as cursor:
+        return await run(cursor, request_attr.select, guild_id, member_id, ident)
+
+
+async def insert_achievement(guild_id, a_name, icon, condition, description):
+    """Insert a reward in the database"""
+    async with connect() as cursor:
+        return await run(cursor, achievements.insert, guild_id, a_name, icon, condition, description)
+
+
+async def select_achievements(guild, ident = None, name = None, icon = None, condition = None):
+    """Selects request attributions"""
+    async with connect() as cursor:
+        return await run(cursor, achievements.select, guild, ident, name, icon, condition)
+
+
+async def select_achievement_attr(guild, member = None, achievement = None):
+    """Selects achievement attributions"""
+    async with connect() as cursor:
+        return await run(cursor, achievement_attr.select, guild, member, achievement)
+
+
+async def award_achievement(guild, member, achievement):
+    """Award achievement to a member"""
+    async with connect() as cursor:
+        return await run(cursor, achievement_attr.insert, guild, member, achievement)
+
+
+async def achievement_delete(guild_id, a_name):
+    async with connect() as cursor:
+        return await run(cursor, achievements.delete, guild_id, a_name=a_name)
+
+
+async def insert_submission(member, message, images, users, duration):
+    """Saves a pending submission expiring in duration seconds, dropping the expired ones"""
+    async with connect() as cursor:
+        await run(cursor, submissions.delete_expired)
+        return await run(cursor, submissions.insert, member, message, images, users, duration)
+
+
+async def get_submission(member, message):
+    async with connect() as cursor:
+        return await run(cursor, submissions.select, member, message)
+
+
+async def update_submission(member, message, request_type = None, request_name = None, effect = None):
+    async with connect() as cursor:
+        return await run(cursor, submissions.update, member, message, request_type, request_name, effect)
+
+
+async def lock_submission(member, message):
+    """True if the lock was obtained"""
+    async with connect() as cursor:
+        return await run(cursor, submissions.lock, member, message) is not None
+
+
+async def delete_submission(member, message):
+    async with connect() as cursor:
+        return await run(cursor, submissions.delete, member, message)
@@ -3,9 +3,10 @@
 # pylint: disable=E1129
 
 import os
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
-import psycopg
+from psycopg_pool import ConnectionPool
 import dao.guilds as guilds
 import dao.members as members
 import dao.requests as requests
@@ -23,8 +24,39 @@ DB_USER = os.environ.get("db_user")
 DB_NAME = os.environ.get("db_name")
 PORT = os.environ.get("port")
 
+POOL_MIN_SIZE = int(os.environ.get("db_pool_min") or "1")
+POOL_MAX_SIZE = int(os.environ.get("db_pool_max") or "10")
+POOL_MAX_IDLE = float(os.environ.get("db_pool_max_idle") or "600")
+POOL_MAX_LIFETIME = float(os.environ.get("db_pool_max_lifetime") or "3600")
+POOL_TIMEOUT = float(os.environ.get("db_pool_timeout") or "30")
+
 connection_string = f"dbname={DB_NAME} user={DB_USER} host={HOST} password={PASSWORD} port={PORT}"
 
+# Connections are borrowed from this pool instead of reconnecting for every request.
+# Idle connections are closed after max_idle seconds, every connection is recycled after
+# max_lifetime seconds and is checked before being handed out.
+pool = ConnectionPool(
+    connection_string,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    max_idle=POOL_MAX_IDLE,
+    max_lifetime=POOL_MAX_LIFETIME,
+    timeout=POOL_TIMEOUT,
+    check=ConnectionPool.check_connection,
+    open=False,
+)
+
+
+@contextmanager
+def connect():
+    """Borrow a cursor from the pool, the transaction is committed on exit"""
+    if pool.closed:
+        pool.open()
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            yield cursor
+
+
 def setup(
     guild_id: int,
     guild_name: int,
@@ -34,132 +66,151 @@ def setup(
     info_channel: int,
     cooldown: int,
 ):
-    # Reconnecting everytime because else the connect object will go out of scope
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            if guild_exists(cursor, guild_id):
-                return guilds.update(
-                    cursor,
-                    guild_id,
-                    guild_name,
-                    currency,
-                    submission_channel,
-                    review_channel,
-                    info_channel,
-                    cooldown,
-                )
-            else:
-                return guilds.insert(
-                    cursor,
-                    guild_id,
-                    guild_name,
-                    currency,
-                    submission_channel,
-                    review_channel,
-                    info_channel,
-                    None,
-                    cooldown,
-                )
+    with connect() as cursor:
+        if guild_exists(cursor, guild_id):
+            return guilds.update(
+                cursor,
+                guild_id,
+                guild_name,
+                currency,
+                submission_channel,
+                review_channel,
+                info_channel,
+                cooldown,
+            )
+        else:
+            return guilds.insert(
+                cursor,
+                guild_id,
+                guild_name,
+                currency,
+                submission_channel,
+                review_channel,
+                info_channel,
+                None,
+                cooldown,
+            )
 
 
 def get_guild(guild_id: int):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return guilds.select(cursor, guild_id)
+    with connect() as cursor:
+        return guilds.select(cursor, guild_id)
 
 
 def get_rank(guild_id: int, member_id: int):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.rank(cursor, guild_id, member_id)[0][0]
+    with connect() as cursor:
+        return members.rank_of(cursor, guild_id, member_id)[0]
 
 
-def get_leaderboard(guild_id: int):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.rank(cursor, guild_id)
+def get_rank_window(guild_id: int, member_id: int, size: int = 2):
+    """Rows of rank, id, nickname, points for the member and up to size members on each side"""
+    with connect() as cursor:
+        db_member = members.select(cursor, guild_id, member_id)
+        if db_member is None:
+            return []
+        rank = members.rank_of(cursor, guild_id, member_id)[0]
+        points = db_member[members.POINTS]
+        above = members.ranked_above(cursor, guild_id, member_id, points, size)
+        below = members.ranked_below(cursor, guild_id, member_id, points, size)
+    return rank_window(rank, db_member, above, below)
+
+
+def count_members(guild_id: int):
+    with connect() as cursor:
+        return members.count(cursor, guild_id)[0]
+
+
+def get_leaderboard_page(guild_id: int, limit: int, after=None, before=None, from_end=False):
+    """Rows of id, nickname, points in rank order, one page at a time.
+    after and before are the (points, id) of the row preceding or following the page,
+    from_end gets the last page. Otherwise the page starts at the top of the leaderboard"""
+    with connect() as cursor:
+        if after is not None:
+            return members.ranked_below(cursor, guild_id, after[1], after[0], limit)
+        if before is not None:
+            return members.ranked_above(cursor, guild_id, before[1], before[0], limit)[::-1]
+        if from_end:
+            return members.bottom(cursor, guild_id, limit)[::-1]
+        return members.top(cursor, guild_id, limit)
 
 
 def fetch_member(guild_id: int, member_id: int, nickname: str):
     """Refreshes and return db member"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return refresh_and_get_member(cursor, guild_id, member_id, nickname)
+    with connect() as cursor:
+        return refresh_and_get_member(cursor, guild_id, member_id, nickname)
 
 
 def get_member(guild_id: int, member_id: int):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.select(cursor, guild_id, member_id)
+    with connect() as cursor:
+        return members.select(cursor, guild_id, member_id)
 
 
 def update_member_submission(guild_id: int, member_id: int, last_submission: str):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.update_submission(
-                cursor, guild_id, member_id, last_submission
-            )
+    with connect() as cursor:
+        return members.update_submission(
+            cursor, guild_id, member_id, last_submission
+        )
 
 def update_cooldown(guild_id: int, member_id: int, next_submission_time: datetime):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.set_cooldown(
-                cursor, guild_id, member_id, next_submission_time
-            )
+    with connect() as cursor:
+        return members.set_cooldown(
+            cursor, guild_id, member_id, next_submission_time
+        )
 
 def cooldown_reset(guild_id: int, member_id: int):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.reset_cooldown(cursor, guild_id, member_id)
+    with connect() as cursor:
+        return members.reset_cooldown(cursor, guild_id, member_id)
 
 
 def request_register(guild_id, request_type, name, effect, value):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return requests.insert(cursor, guild_id, request_type, name, effect, value)
+    with connect() as cursor:
+        return requests.insert(cursor, guild_id, request_type, name, effect, value)
 
 
 def request_delete(guild_id, ident = None, request_type = None, request_name = None, effect = None, list_ident = None):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return requests.delete(cursor, guild_id, ident, request_type, request_name, effect, list_ident)
+    with connect() as cursor:
+        return requests.delete(cursor, guild_id, ident, request_type, request_name, effect, list_ident)
 
 
 def get_request(guild_id, request_type, name, effect):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return requests.selectOne(cursor, guild_id, request_type, name, effect)
+    with connect() as cursor:
+        return requests.selectOne(cursor, guild_id, request_type, name, effect)
 
 
 def get_requests(guild_id, request_type=None, name=None, effect=None, list_ident=None):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return requests.select(
-                cursor,
-                guild_id,
-                request_type=request_type,
-                request_name=name,
-                effect=effect,
-                list_ident=list_ident,
-            )
+    with connect() as cursor:
+        return requests.select(
+            cursor,
+            guild_id,
+            request_type=request_type,
+            request_name=name,
+            effect=effect,
+            list_ident=list_ident,
+        )
 
 
 def add_points(guild_id, member_id, points):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.add_points(cursor, guild_id, member_id, points)
+    with connect() as cursor:
+        return members.add_points(cursor, guild_id, member_id, points)
 
 
 def add_spent(guild_id, member_id, points):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.add_spent(cursor, guild_id, member_id, points)
+    with connect() as cursor:
+        return members.add_spent(cursor, guild_id, member_id, points)
 
 
 def set_theme(guild_id, member_id, theme):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return members.set_theme(cursor, guild_id, member_id, theme)
+    with connect() as cursor:
+        return members.set_theme(cursor, guild_id, member_id, theme)
+
+
+def rank_window(rank, db_member, above, below):
+    """Numbers the members around a ranked member"""
+    window = [(rank - i - 1, *row) for i, row in enumerate(above)]
+    window.reverse()
+    window.append((rank, db_member[members.ID], db_member[members.NICKNAME], db_member[members.POINTS]))
+    window.extend((rank + i + 1, *row) for i, row in enumerate(below))
+    return window
 
 
 def guild_exists(cursor, guild_id):
@@ -169,119 +220,92 @@ def guild_exists(cursor, guild_id):
 
 def refresh_and_get_member(cursor, guild_id, member_id, nickname):
     """Create member if it doesn't exist, update its nickname then gets it"""
-    db_member = members.select(cursor, guild_id, member_id)
-    if db_member is None:
-        members.insert(cursor, guild_id, member_id, nickname, 0, 0, datetime.min, None, 0)
+    db_member = members.upsert(cursor, guild_id, member_id, nickname, datetime.min)
+    if db_member is None:  # Inserted concurrently after the statement started
         db_member = members.select(cursor, guild_id, member_id)
-    else:  # Update nickname for database maintenability
-        members.update(
-            cursor,
-            db_member[members.GUILD],
-            db_member[members.ID],
-            nickname,
-            db_member[members.POINTS],
-            db_member[members.SPENT],
-            db_member[members.NEXT_SUBMISSION_TIME],
-            db_member[members.LAST_SUBMISSION],
-            db_member[members.THEME],
-        )
     return db_member
 
 
 def insert_reward(guild_id, name, condition, nature, reward_id, points_required):
     """Insert a reward in the database"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return rewards.insert(
-                cursor, guild_id, name, condition, nature, reward_id, points_required
-            )
+    with connect() as cursor:
+        return rewards.insert(
+            cursor, guild_id, name, condition, nature, reward_id, points_required
+        )
 
 def delete_reward(guild_id, list_ident=None, name=None, condition=None, nature=None, reward_id=None):
     """Delete a reward in the database"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return rewards.delete(cursor, guild_id, list_ident, name, condition, nature, reward_id)
+    with connect() as cursor:
+        return rewards.delete(cursor, guild_id, list_ident, name, condition, nature, reward_id)
 
 
 def get_rewards(guild_id, list_ident=None, name=None, condition=None, nature=None, reward_id=None):
     """Selects a reward in the database"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return rewards.select(cursor, guild_id, list_ident, name, condition, nature, reward_id)
+    with connect() as cursor:
+        return rewards.select(cursor, guild_id, list_ident, name, condition, nature, reward_id)
 
 
 def award_reward(guild_id, user_id, reward):
     """Links a reward to a user"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return reward_attr.insert(cursor, guild_id, user_id, reward)
+    with connect() as cursor:
+        return reward_attr.insert(cursor, guild_id, user_id, reward)
 
 
 def deny_reward(guild_id, user_id, reward):
     """Unlinks a reward to a user"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return reward_attr.delete(cursor, guild_id, user_id, reward)
+    with connect() as cursor:
+        return reward_attr.delete(cursor, guild_id, user_id, reward)
 
 
 def get_reward_attribution(guild_id, user_id, ident = None):
     """Selects award attributions"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return reward_attr.select(cursor, guild_id, user_id, ident)
+    with connect() as cursor:
+        return reward_attr.select(cursor, guild_id, user_id, ident)
 
 
 def award_request(guild_id, user_id, request):
     """Links a request to a user"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return request_attr.insert(cursor, guild_id, user_id, request)
+    with connect() as cursor:
+        return request_attr.insert(cursor, guild_id, user_id, request)
 
 
 def deny_request(guild_id, user_id, request):
     """Unlinks a request to a user"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return request_attr.delete(cursor, guild_id, user_id, request)
+    with connect() as cursor:
+        return request_attr.delete(cursor, guild_id, user_id, request)
 
 
 def get_request_attribution(guild_id, member_id, ident = None):
     """Gets request attributions"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return request_attr.select(cursor, guild_id, member_id, ident)
+    with connect() as cursor:
+        return request_attr.select(cursor, guild_id, member_id, ident)
 
           
 def insert_achievement(guild_id, a_name, icon, condition, description):
     """Insert a reward in the database"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return achievements.insert(cursor, guild_id, a_name, icon, condition, description)
+    with connect() as cursor:
+        return achievements.insert(cursor, guild_id, a_name, icon, condition, description)
 
 
 def select_achievements(guild, ident = None, name = None, icon = None, condition = None):
     """Selects request attributions"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return achievements.select(cursor, guild, ident, name, icon, condition)
+    with connect() as cursor:
+        return achievements.select(cursor, guild, ident, name, icon, condition)
 
 
 def select_achievement_attr(guild, member = None, achievement = None):
     """Selects achievement attributions"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return achievement_attr.select(cursor, guild, member, achievement)
+    with connect() as cursor:
+        return achievement_attr.select(cursor, guild, member, achievement)
 
 
 def award_achievement(guild, member, achievement):
     """Award achievement to a member"""
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return achievement_attr.insert(cursor, guild, member, achievement)
+    with connect() as cursor:
+        return achievement_attr.insert(cursor, guild, member, achievement)
 
 
 def achievement_delete(guild_id, a_name):
-    with psycopg.connect(connection_string) as connection:
-        with connection.cursor() as cursor:
-            return achievements.delete(cursor, guild_id, a_name=a_name)
-            
\ No newline at end of file
+    with connect() as cursor:
+        return achievements.delete(cursor, guild_id, a_name=a_name)
+        
\ No newline at end of file
@@ -18,6 +18,20 @@ def update(cursor, guild_id, member_id, nickname, points, spent, next_submission
     cursor.execute(f"UPDATE {TABLE_NAME} SET nickname=%s, points=%s, spent=%s, next_submission_time=%s, last_submission=%s, theme=%s WHERE guild=%s AND id=%s",
         [nickname, points, spent, next_submission_time, last_submission, guild_id, member_id, theme])
 
+def upsert(cursor, guild_id, member_id, nickname, next_submission_time):
+    """Insert the member or refresh its nickname, then return it in a single statement.
+    The row is only written when the nickname actually changed"""
+    cursor.execute(f"WITH upserted AS (INSERT INTO {TABLE_NAME} (guild, id, nickname, points, spent, next_submission_time, last_submission, theme) "
+        "values(%s, %s, %s, 0, 0, %s, NULL, 0) "
+        f"ON CONFLICT (guild, id) DO UPDATE SET nickname=EXCLUDED.nickname WHERE {TABLE_NAME}.nickname IS DISTINCT FROM EXCLUDED.nickname "
+        "RETURNING guild, id, nickname, points, spent, next_submission_time, last_submission, theme) "
+        "SELECT guild, id, nickname, points, spent, next_submission_time, last_submission, theme FROM upserted "
+        "UNION ALL "
+        f"SELECT guild, id, nickname, points, spent, next_submission_time, last_submission, theme FROM {TABLE_NAME} "
+        "WHERE guild=%s AND id=%s AND NOT EXISTS (SELECT 1 FROM upserted)",
+        [guild_id, member_id, nickname, next_submission_time, guild_id, member_id])
+    return cursor.fetchone()
+
 def update_submission(cursor, guild_id, member_id, last_submission):
     cursor.execute(f"UPDATE {TABLE_NAME} SET last_submission=%s WHERE guild=%s AND id=%s",
         [last_submission, guild_id, member_id])
@@ -47,14 +61,45 @@ def select(cursor, guild_id, member_id):
         [guild_id, member_id])
     return cursor.fetchone()
 
-def rank(cursor, guild_id, member_id = None):
-    req = (";WITH cte AS("
-        f"SELECT ROW_NUMBER() OVER(ORDER BY points DESC) rank, id, nickname, points FROM {TABLE_NAME} "
-        "WHERE guild=%s) "
-        "SELECT rank, id, nickname, points FROM cte ")
-    parm = [guild_id]
-    if member_id is not None:
-        req = f"{req}WHERE id=%s "
-        parm.insert(len(parm), member_id)
-    cursor.execute(req,parm)
-    return cursor.fetchall()
\ No newline at end of file
+# Members are ranked by points, ties are broken by the lowest id.
+# (guild, points DESC, id) is indexed so these only read the members around the one asked for
+def rank_of(cursor, guild_id, member_id):
+    """Rank of one member, counts the members ranked before them"""
+    cursor.execute(f"SELECT COUNT(*) + 1 FROM {TABLE_NAME} m JOIN {TABLE_NAME} me ON me.guild=m.guild AND me.id=%s "
+        "WHERE m.guild=%s AND m.points >= me.points AND (m.points > me.points OR m.id < me.id)",
+        [member_id, guild_id])
+    return cursor.fetchone()
+
+def count(cursor, guild_id):
+    cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE guild=%s", [guild_id])
+    return cursor.fetchone()
+
+def top(cursor, guild_id, limit):
+    """Best ranked members"""
+    cursor.execute(f"SELECT id, nickname, points FROM {TABLE_NAME} WHERE guild=%s "
+        "ORDER BY points DESC, id LIMIT %s",
+        [guild_id, limit])
+    return cursor.fetchall()
+
+def bottom(cursor, guild_id, limit):
+    """Worst ranked members, last first"""
+    cursor.execute(f"SELECT id, nickname, points FROM {TABLE_NAME} WHERE guild=%s "
+        "ORDER BY points, id DESC LIMIT %s",
+        [guild_id, limit])
+    return cursor.fetchall()
+
+def ranked_above(cursor, guild_id, member_id, points, limit):
+    """Members ranked right before the given one, closest first"""
+    cursor.execute(f"SELECT id, nickname, points FROM {TABLE_NAME} "
+        "WHERE guild=%s AND points >= %s AND (points > %s OR id < %s) "
+        "ORDER BY points, id DESC LIMIT %s",
+        [guild_id, points, points, member_id, limit])
+    return cursor.fetchall()
+
+def ranked_below(cursor, guild_id, member_id, points, limit):
+    """Members ranked right after the given one, closest first"""
+    cursor.execute(f"SELECT id, nickname, points FROM {TABLE_NAME} "
+        "WHERE guild=%s AND points <= %s AND (points < %s OR id > %s) "
+        "ORDER BY points DESC, id LIMIT %s",
+        [guild_id, points, points, member_id, limit])
+    return cursor.fetchall()
@@ -7,13 +7,14 @@ REQUEST = 2
 def insert(cursor, guild, member, request):
     """Insert an element in the database"""
     cursor.execute(f"INSERT INTO {TABLE_NAME} (guild, member, request)"
-        " values(%s, %s, %s)",
+        " values(%s, %s, %s)"
+        " ON CONFLICT DO NOTHING",
         [guild, member, request])
 
 def select(cursor, guild, member = None, request = None):
     """Select constructed depending on the parameters that's given to it"""
     req = (f"SELECT guild, member, request FROM {TABLE_NAME}"
-        " where guild=%s")
+        " where guild=%s ")
     parm = []
     if member is not None:
         req = f"{req}AND member=%s "
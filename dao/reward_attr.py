@@ -13,7 +13,7 @@ def insert(cursor, guild, member, reward):
 def select(cursor, guild, member = None, reward = None):
     """Select constructed depending on the parameters that's given to it"""
     req = (f"SELECT guild, member, reward FROM {TABLE_NAME}"
-        " where guild=%s")
+        " where guild=%s ")
     parm = []
     if member is not None:
         req = f"{req}AND member=%s "
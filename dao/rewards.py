@@ -18,7 +18,7 @@ def insert(cursor, guild, name, condition, nature, r_role, points_required):
 def select(cursor, guild, list_ident = None, name = None, condition = None, nature = None, r_role = None):
     """Select constructed depending on the parameters that's given to it"""
     req = (f"SELECT guild, ident, r_name, condition, nature, r_role, points_required FROM {TABLE_NAME}"
-        " where guild=%s")
+        " where guild=%s ")
     parm = []
     if(list_ident is not None):
         req = f"{req}AND ident=ANY(%s) "
@@ -43,7 +43,7 @@ def select(cursor, guild, list_ident = None, name = None, condition = None, natu
 
 def delete(cursor, guild, list_ident = None, name = None, condition = None, nature = None, r_role = None):
     """Delete an element from the database"""
-    req = f"DELETE FROM {TABLE_NAME} WHERE guild=%s"
+    req = f"DELETE FROM {TABLE_NAME} WHERE guild=%s "
     parm = []
     if(list_ident is not None):
         req = f"{req}AND ident=ANY(%s) "
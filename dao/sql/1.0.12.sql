@@ -0,0 +1,17 @@
+-- Leaderboard and rank lookups sort a guild's members by points
+CREATE INDEX IF NOT EXISTS members_guild_points_idx ON members (guild, points DESC, id);
+
+-- Since 1.0.8 these tables are keyed by ident only, but they are always filtered by guild
+CREATE INDEX IF NOT EXISTS requests_guild_idx ON requests (guild, request_type, request_name, effect);
+CREATE INDEX IF NOT EXISTS rewards_guild_idx ON rewards (guild, ident);
+CREATE INDEX IF NOT EXISTS achievements_guild_idx ON achievements (guild, ident);
+
+-- Attribution primary keys already start with (guild, member),
+-- these indexes serve the ON DELETE CASCADE of their foreign keys
+CREATE INDEX IF NOT EXISTS reward_attr_reward_idx ON reward_attr (reward);
+CREATE INDEX IF NOT EXISTS request_attr_request_idx ON request_attr (request);
+CREATE INDEX IF NOT EXISTS achievement_attr_achievement_idx ON achievement_attr (achievement);
+
+ANALYZE members, requests, rewards, achievements, reward_attr, request_attr, achievement_attr;
+
+UPDATE metanarga SET data_model_version = '1.0.12';
@@ -0,0 +1,15 @@
+CREATE TABLE submissions (
+    member numeric NOT NULL,
+    message numeric NOT NULL,
+    images text[] NOT NULL,
+    users numeric[] NOT NULL,
+    request_type text,
+    request_name text,
+    effect text,
+    locked boolean NOT NULL DEFAULT false,
+    expires timestamp NOT NULL,
+    PRIMARY KEY(member, message)
+);
+CREATE INDEX submissions_expires_idx ON submissions (expires);
+
+UPDATE metanarga SET data_model_version = '1.0.13';
@@ -0,0 +1,59 @@
+"""Submissions table, pending reviews when sessions are persisted"""
+TABLE_NAME = "submissions"
+MEMBER = 0
+MESSAGE = 1
+IMAGES = 2
+USERS = 3
+REQUEST_TYPE = 4
+REQUEST_NAME = 5
+EFFECT = 6
+LOCKED = 7
+EXPIRES = 8
+
+def insert(cursor, member, message, images, users, duration):
+    """Insert an element in the database, it expires in duration seconds"""
+    cursor.execute(f"INSERT INTO {TABLE_NAME} (member, message, images, users, expires)"
+        " values(%s, %s, %s, %s, NOW() + %s * INTERVAL '1 second')"
+        " ON CONFLICT (member, message) DO UPDATE SET images=EXCLUDED.images, users=EXCLUDED.users,"
+        " request_type=NULL, request_name=NULL, effect=NULL, locked=false, expires=EXCLUDED.expires",
+        [member, message, images, users, duration])
+
+def select(cursor, member, message):
+    """Select a submission that hasn't expired"""
+    cursor.execute("SELECT member, message, images, users, request_type, request_name, effect, locked, expires"
+        f" FROM {TABLE_NAME} WHERE member=%s AND message=%s AND expires > NOW()",
+        [member, message])
+    return cursor.fetchone()
+
+def update(cursor, member, message, request_type = None, request_name = None, effect = None):
+    """Set the fields that are given"""
+    req = f"UPDATE {TABLE_NAME} SET member=member "
+    parm = []
+    if request_type is not None:
+        req = f"{req}, request_type=%s "
+        parm.insert(len(parm),request_type)
+    if request_name is not None:
+        req = f"{req}, request_name=%s "
+        parm.insert(len(parm),request_name)
+    if effect is not None:
+        req = f"{req}, effect=%s "
+        parm.insert(len(parm),effect)
+    req = f"{req}WHERE member=%s AND message=%s"
+    parm.extend([member, message])
+    cursor.execute(req,parm)
+
+def lock(cursor, member, message):
+    """Lock a submission, only one caller can obtain the lock"""
+    cursor.execute(f"UPDATE {TABLE_NAME} SET locked=true"
+        " WHERE member=%s AND message=%s AND NOT locked AND expires > NOW() RETURNING member",
+        [member, message])
+    return cursor.fetchone()
+
+def delete(cursor, member, message):
+    """Delete an element from the database"""
+    cursor.execute(f"DELETE FROM {TABLE_NAME} WHERE member=%s AND message=%s",
+        [member, message])
+
+def delete_expired(cursor):
+    """Delete all the expired submissions"""
+    cursor.execute(f"DELETE FROM {TABLE_NAME} WHERE expires <= NOW()")
@@ -0,0 +1,116 @@
+"""Leaderboard paginated on demand, only the page being viewed is fetched and rendered"""
+
+from interactions import ComponentContext
+from interactions.ext.paginators import Paginator
+import dao.async_dao as dao
+import tools
+
+PODIUM_SIZE = 3
+CHUNK_SIZE = 15
+ID = 0
+NICKNAME = 1
+POINTS = 2
+
+
+class LeaderboardPages:
+    """Sequence of leaderboard embeds for the paginator, holding only the current page.
+    Pages are fetched by keyset from the rows bordering the current page"""
+
+    def __init__(self, guild_id, currency, total):
+        self.guild_id = guild_id
+        self.currency = currency
+        self.total = total
+        # The podium only makes sense if there are enough members to fill it
+        self.podium = total >= PODIUM_SIZE
+        self.index = None
+        self.rows = []
+        self.embed = None
+
+    def __len__(self):
+        if not self.podium:
+            return 1
+        return 1 + -(-(self.total - PODIUM_SIZE) // CHUNK_SIZE)
+
+    def __getitem__(self, index):
+        if index != self.index:
+            raise IndexError(f"Leaderboard page {index} hasn't been loaded")
+        return self.embed
+
+    def start(self, index):
+        """Position of the first member of a page in the leaderboard"""
+        if index == 0:
+            return 0
+        return PODIUM_SIZE + (index - 1) * CHUNK_SIZE
+
+    def size(self, index):
+        """Number of members on a page"""
+        if not self.podium:
+            return self.total
+        if index == 0:
+            return PODIUM_SIZE
+        return min(CHUNK_SIZE, self.total - self.start(index))
+
+    async def load(self, index):
+        """Fetch the members of a page and build its embed"""
+        if index == self.index:
+            return
+        limit = self.size(index)
+        if index == 0:
+            rows = await dao.get_leaderboard_page(self.guild_id, limit)
+        elif index == len(self) - 1:
+            rows = await dao.get_leaderboard_page(self.guild_id, limit, from_end=True)
+        elif index == self.index + 1:
+            last = self.rows[-1]
+            rows = await dao.get_leaderboard_page(
+                self.guild_id, limit, after=(last[POINTS], last[ID])
+            )
+        else:  # Previous page
+            first = self.rows[0]
+            rows = await dao.get_leaderboard_page(
+                self.guild_id, limit, before=(first[POINTS], first[ID])
+            )
+        names = [row[NICKNAME] for row in rows]
+        points = [row[POINTS] for row in rows]
+        if self.podium and index == 0:
+            self.embed = tools.generate_podium(names, points, self.currency)
+        else:
+            ranks = range(self.start(index) + 1, self.start(index) + len(rows) + 1)
+            self.embed = tools.generate_rank_embeds(ranks, names, points, self.currency)
+        self.index = index
+        self.rows = rows
+
+
+class LeaderboardPaginator(Paginator):
+    """Paginator loading each page of the leaderboard when it is displayed"""
+
+    @classmethod
+    async def create(cls, client, guild_id, currency, timeout: int = 0):
+        """Count the members and load the first page. The count is cached, the last page
+        is read from the end of the leaderboard so it shows the members who joined since"""
+        total = await dao.count_members(guild_id)
+        if total == 0:
+            return None
+        pages = LeaderboardPages(guild_id, currency, total)
+        await pages.load(0)
+        return cls(client, pages=pages, timeout_interval=timeout)
+
+    async def _on_button(self, ctx: ComponentContext, *args, **kwargs):
+        if ctx.author.id != self.author_id:
+            return await ctx.send(self.wrong_user_message, ephemeral=True)
+        if self._timeout_task:
+            self._timeout_task.ping.set()
+        match ctx.custom_id.split("|")[1]:
+            case "first":
+                index = 0
+            case "last":
+                index = len(self.pages) - 1
+            case "next":
+                index = min(self.page_index + 1, len(self.pages) - 1)
+            case "back":
+                index = max(self.page_index - 1, 0)
+            case _:
+                index = self.page_index
+        await self.pages.load(index)
+        self.page_index = index
+        await ctx.edit_origin(**self.to_dict())
+        return None
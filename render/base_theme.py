@@ -1,5 +1,4 @@
 """Interface for themes"""
-from wand.image import Image
 import render.render_tools as render_tools
 
 class BaseTheme:
@@ -25,6 +24,11 @@ class BaseTheme:
     def render_background(self, canvas, seed = 0):
         """Renders a background for the theme"""
 
+    def render_static(self, canvas):
+        """Renders what is the same on every card of the theme, it is drawn once
+        and composited over the background. The border by default"""
+        self.render_border(canvas)
+
     def render_border(self, canvas, seed = 0):
         """Renders borders for the theme"""
 
@@ -43,11 +47,21 @@ class BaseTheme:
     def draw_achievements(self, achievements):
         """Add the achievements picture to the canvas"""
 
-    def save_final_render(self, canvas, path):
-        """Renders the canvas to an image"""
-        with Image(width=self.width, height=self.height, background=render_tools.TRANSPARENT) as img:
-            canvas(img)
-            render_tools.overlay_images(img, self.image_desc)
-            with Image(blob = self.background) as background:
-                background.composite(img)
-                background.save(filename=path)
+    def draw_layer(self, canvas):
+        """Image of what was drawn on the canvas, the caller closes it"""
+        img = render_tools.new_image(self.width, self.height)
+        canvas(img)
+        return img
+
+    def compose(self, img):
+        """The background with the images and then img on top, the caller closes it"""
+        render_tools.overlay_images(img, self.image_desc)
+        background = render_tools.open_image(blob = self.background)
+        render_tools.composite(background, img)
+        return background
+
+    def save_final_render(self, canvas):
+        """Renders the canvas to the bytes of the card, see render_tools.encode"""
+        with self.draw_layer(canvas) as img:
+            with self.compose(img) as card:
+                return render_tools.encode(card)
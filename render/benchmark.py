@@ -0,0 +1,265 @@
+"""Renders guild cards for every theme with fixed inputs and reports the time of each stage.
+Run from the root of the repository: python -m render.benchmark"""
+
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from contextlib import contextmanager
+from statistics import mean, median
+import render.render as render
+import render.render_tools as render_tools
+
+SEEDS = [161774022764396544, 283946201744113665, 906452171120033792]
+ACHIEVEMENT_COUNTS = [0, 9, 45]
+STAGES = ["background", "text", "overlays", "encode"]
+# (encoding, zlib level), None is the backend's default level
+ENCODERS = [("png", None), ("png", 1), ("png", 9), ("png8", None), ("png8", 9), ("webp", None)]
+NAME = "Benchmark member"
+CURRENCY = "Coins"
+
+
+def reset_peak_rss():
+    """Starts a new measure of the peak resident memory of this process, False if
+    the system can't: resetting the peak needs Linux' /proc/self/clear_refs"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def read_rss():
+    """Current and peak resident memory of this process in bytes, from /proc/self/status"""
+    values = {}
+    with open("/proc/self/status", "r", encoding="ascii") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                values[name] = int(value.split()[0]) * 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+@contextmanager
+def measure(stage, timings, peaks, memory=False):
+    """Times a stage and with memory set, how much the peak resident memory of the process
+    rose above the memory in use when the stage started. It counts the pixels held by
+    ImageMagick or Pillow, but not memory the stage reused after an earlier stage freed it.
+    When tracemalloc is tracing, the peak of the Python allocations is recorded too"""
+    if memory:
+        reset_peak_rss()
+        start_rss = read_rss()[0]
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        start_traced = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+    peaks[stage] = {}
+    if memory:
+        peaks[stage]["rss"] = read_rss()[1] - start_rss
+    if tracemalloc.is_tracing():
+        peaks[stage]["traced"] = tracemalloc.get_traced_memory()[1] - start_traced
+
+
+def make_icon(size, index):
+    """Plain square icon of a color depending on index, as PNG bytes"""
+    color = f"#{(index * 40) % 256:02x}{(index * 90) % 256:02x}{(index * 150) % 256:02x}"
+    with render_tools.Drawing() as canvas:
+        render_tools.draw_rect(canvas, 0, 0, size, size, fill=color)
+        with render_tools.new_image(size, size) as icon:
+            canvas(icon)
+            return render_tools.to_png(icon)
+
+
+def clear_caches():
+    """Empty the in memory caches so every render starts cold"""
+    render.background_cache.memory.clear()
+    render.static_cache.clear()
+    render_tools.sprite_cache.clear()
+    render_tools.decoded_cache.clear()
+    render_tools.strip_cache.clear()
+
+
+def draw_text(theme, canvas):
+    """The texts of the benchmark card"""
+    render.draw_card_text(theme, canvas, NAME, CURRENCY, 55, 155, 3, "You can submit now")
+
+
+def compose(theme_name, seed, pfp, icons):
+    """Finished card before it is encoded"""
+    theme = render.load_theme(theme_name)
+    render.render_background(theme, seed)
+    with render_tools.Drawing() as canvas:
+        draw_text(theme, canvas)
+        render.add_card_images(theme, icons, pfp)
+        with theme.draw_layer(canvas) as img:
+            return theme.compose(img)
+
+
+def render_stages(theme_name, seed, pfp, icons, memory=False):
+    """Renders a card with the stages of render.generate_guild_card, returns the seconds spent
+    in each stage and the peaks of memory of each stage measured by measure()"""
+    timings = {}
+    peaks = {}
+    theme = render.load_theme(theme_name)
+    with measure("background", timings, peaks, memory):
+        render.render_background(theme, seed)
+    with render_tools.Drawing() as canvas:
+        with measure("text", timings, peaks, memory):
+            draw_text(theme, canvas)
+            img = theme.draw_layer(canvas)
+        with img:
+            with measure("overlays", timings, peaks, memory):
+                render.add_card_images(theme, icons, pfp)
+                card = theme.compose(img)
+            with card:
+                with measure("encode", timings, peaks, memory):
+                    render_tools.encode(card)
+    return timings, peaks
+
+
+def summary(samples):
+    """Statistics in milliseconds of a list of durations in seconds"""
+    return {
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(median(samples) * 1000, 3),
+        "mean_ms": round(mean(samples) * 1000, 3),
+    }
+
+
+def run(iterations, warm, memory, traced):
+    """Benchmarks every theme with every number of achievements. memory measures the peak
+    resident memory of each stage, traced also the Python allocations with tracemalloc,
+    which slows the renders down"""
+    # The disk tier would make results depend on previous runs
+    render.background_cache.disk = None
+    pfp = render.resize(render.ICON_SIZE, render.ICON_SIZE, blob=make_icon(render.AVATAR_SIZE, 0))
+    all_icons = [make_icon(render.SMALL_ICON, i) for i in range(max(ACHIEVEMENT_COUNTS))]
+    columns = (["rss"] if memory else []) + (["traced"] if traced else [])
+    results = []
+    if traced:
+        tracemalloc.start()
+    for theme_name in render.list_themes():
+        for count in ACHIEVEMENT_COUNTS:
+            samples = {stage: [] for stage in STAGES}
+            peak_samples = {(stage, column): [] for stage in STAGES for column in columns}
+            totals = []
+            for i in range(iterations):
+                if not warm:
+                    clear_caches()
+                timings, peaks = render_stages(
+                    theme_name, SEEDS[i % len(SEEDS)], pfp, all_icons[:count], memory
+                )
+                for stage in STAGES:
+                    samples[stage].append(timings[stage])
+                    for column in columns:
+                        peak_samples[stage, column].append(peaks[stage][column])
+                totals.append(sum(timings.values()))
+            stages = {stage: summary(samples[stage]) for stage in STAGES}
+            for (stage, column), values in peak_samples.items():
+                stages[stage][f"{column}_peak_kb"] = {
+                    "median": round(median(values) / 1024, 1),
+                    "max": round(max(values) / 1024, 1),
+                }
+            results.append(
+                {
+                    "theme": theme_name,
+                    "achievements": count,
+                    "stages": stages,
+                    "total": summary(totals),
+                }
+            )
+    if traced:
+        tracemalloc.stop()
+    return {
+        "backend": render_tools.RENDER_BACKEND,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": iterations,
+        "warm": warm,
+        "memory": memory,
+        "tracemalloc": traced,
+        "encoding": render_tools.CARD_ENCODING,
+        "results": results,
+    }
+
+
+def run_encoders(iterations):
+    """Encodes a card of every theme with each of the ENCODERS"""
+    pfp = render.resize(render.ICON_SIZE, render.ICON_SIZE, blob=make_icon(render.AVATAR_SIZE, 0))
+    icons = [make_icon(render.SMALL_ICON, i) for i in range(9)]
+    results = []
+    for theme_name in render.list_themes():
+        card = compose(theme_name, SEEDS[0], pfp, icons)
+        for encoding, level in ENCODERS:
+            samples = []
+            size = None
+            for _ in range(iterations):
+                image = render_tools.backend.clone(card)
+                start = time.perf_counter()
+                size = len(render_tools.encode(image, encoding, level))
+                samples.append(time.perf_counter() - start)
+                render_tools.backend.close(image)
+            results.append(
+                {
+                    "theme": theme_name,
+                    "encoding": encoding,
+                    "level": level,
+                    "bytes": size,
+                    "time": summary(samples),
+                }
+            )
+        render_tools.backend.close(card)
+    return results
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="renders per case")
+    parser.add_argument("--warm", action="store_true", help="keep the caches between renders")
+    parser.add_argument(
+        "--memory", action="store_true", help="measure the peak resident memory of each stage"
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="also trace the Python allocations of each stage, renders are slower",
+    )
+    parser.add_argument("-o", "--output", help="write the JSON results to this file")
+    parser.add_argument("--encoders", action="store_true", help="also compare the card encodings")
+    args = parser.parse_args()
+    if args.memory and not reset_peak_rss():
+        parser.error("--memory needs /proc/self/clear_refs, available on Linux")
+    results = run(args.iterations, args.warm, args.memory, args.tracemalloc)
+    if args.encoders:
+        results["encoders"] = run_encoders(args.iterations)
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(text)
+        for result in results["results"]:
+            stages = ", ".join(
+                f"{stage} {result['stages'][stage]['median_ms']}ms"
+                + (
+                    f" {result['stages'][stage]['rss_peak_kb']['median']}kB"
+                    if args.memory
+                    else ""
+                )
+                for stage in STAGES
+            )
+            print(f"{result['theme']} {result['achievements']} achievements: {stages}")
+        for result in results.get("encoders", []):
+            print(
+                f"{result['theme']} {result['encoding']} level {result['level']}: "
+                f"{result['bytes']} bytes in {result['time']['median_ms']}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Bounded caches for the rendered images"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def digest(*parts):
+    """Hash of the values, bytes are hashed as they are and anything else by its repr"""
+    sha = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            sha.update(b"b")
+            sha.update(hashlib.sha256(part).digest())
+        else:
+            sha.update(b"r")
+            sha.update(repr(part).encode())
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def remove(path):
+    """Delete a file if it exists"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class LRUCache:
+    """In memory cache, the least recently used entries are evicted past max_entries
+    or when the total size of the values goes over max_bytes"""
+
+    def __init__(self, max_entries, max_bytes=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """The value or default, marks the entry as recently used"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size=None):
+        """Add or replace a value, size defaults to the length of bytes values"""
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, bytearray)) else 0
+        self.pop(key)
+        if self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        self.evict()
+
+    def pop(self, key):
+        """Remove an entry, returns its value or None"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.size -= entry[1]
+        if self.on_evict is not None:
+            self.on_evict(entry[0])
+        return entry[0]
+
+    def evict(self):
+        """Drop the least recently used entries until the cache fits its bounds"""
+        while len(self.entries) > self.max_entries or (
+            self.max_bytes is not None and self.size > self.max_bytes
+        ):
+            self.evictions += 1
+            self.pop(next(iter(self.entries)))
+
+    def stats(self):
+        """Counters and size of the cache"""
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        """Remove every entry"""
+        while len(self.entries) > 0:
+            self.pop(next(iter(self.entries)))
+
+
+class DiskCache:
+    """Files in a directory, the least recently used are deleted past max_bytes
+    and files unused for max_age seconds are deleted when max_age is set.
+    Files are written to a temporary name first so a reader never sees half a file.
+    Processes can share the directory: files written by the others are read on a miss
+    and the budget is checked against a scan of the directory, done at most every
+    scan_interval seconds unless this process goes over it.
+    Keys are digest() hashes, files not named after one are never touched.
+    The methods hold a lock so threads can share an instance"""
+
+    def __init__(self, directory, max_bytes, extension=".png", max_age=None, scan_interval=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.max_age = max_age
+        self.scan_interval = scan_interval
+        self.scanned = 0
+        # key: (size, last use)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Reentrant, evict() calls load() and delete()
+        self.lock = threading.RLock()
+        # <key><extension>, or <key><extension>.<pid>.tmp while it is written
+        self.file_name = re.compile(rf"([0-9a-f]{{64}}){re.escape(extension)}(\.\d+\.tmp)?")
+        if max_bytes > 0:
+            os.makedirs(directory, exist_ok=True)
+            self.evict()
+
+    def load(self):
+        """Rebuild the index from the files of every process, oldest use first.
+        Leftover temporary files are deleted once they are a minute old,
+        younger ones may still be written by another process"""
+        with self.lock:
+            found = []
+            for name in os.listdir(self.directory):
+                match = self.file_name.fullmatch(name)
+                if match is None:
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if match.group(2) is not None:
+                    if stat.st_mtime < time.time() - 60:
+                        remove(path)
+                    continue
+                found.append((stat.st_mtime, match.group(1), stat.st_size))
+            self.entries.clear()
+            self.size = 0
+            for used, key, size in sorted(found):
+                self.entries[key] = (size, used)
+                self.size += size
+            self.scanned = time.time()
+
+    def path(self, key):
+        """File holding the value of a key"""
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    def expired(self, used):
+        """True if an entry last used at this time is too old to be kept"""
+        return self.max_age is not None and used < time.time() - self.max_age
+
+    def get(self, key):
+        """The bytes stored for the key or None, the file may have been written by another process.
+        Its modification time is the last use so every process sees it"""
+        with self.lock:
+            if self.max_bytes <= 0:
+                self.misses += 1
+                return None
+            path = self.path(key)
+            blob = None
+            try:
+                if self.expired(os.stat(path).st_mtime):
+                    self.evictions += 1
+                    self.delete(key)
+                else:
+                    with open(path, "rb") as file:
+                        blob = file.read()
+                    os.utime(path)
+            except OSError:
+                pass
+            self.forget(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[key] = (len(blob), time.time())
+            self.size += len(blob)
+            return blob
+
+    def put(self, key, blob):
+        """Store the bytes for a key"""
+        with self.lock:
+            if self.max_bytes <= 0 or len(blob) > self.max_bytes:
+                return
+            path = self.path(key)
+            temp = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temp, "wb") as file:
+                    file.write(blob)
+                os.replace(temp, path)
+            except OSError as e:
+                print(f"Unable to write {path} to the cache, error {e}")
+                remove(temp)
+                return
+            self.forget(key)
+            self.entries[key] = (len(blob), time.time())
+            self.size += len(blob)
+            if self.size > self.max_bytes or self.scanned < time.time() - self.scan_interval:
+                self.evict()
+
+    def forget(self, key):
+        """Drop a key from the index, leaving the file"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[0]
+
+    def delete(self, key):
+        """Remove a key and its file"""
+        with self.lock:
+            self.forget(key)
+            remove(self.path(key))
+
+    def evict(self):
+        """Scan the directory then delete the least recently used files until it fits max_bytes,
+        then the files that weren't used for max_age"""
+        with self.lock:
+            self.load()
+            while len(self.entries) > 0:
+                key, (_, used) = next(iter(self.entries.items()))
+                if self.size <= self.max_bytes and not self.expired(used):
+                    return
+                self.evictions += 1
+                self.delete(key)
+
+    def stats(self):
+        """Counters and size of the cache"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class TieredCache:
+    """Memory cache in front of a disk cache, disk hits are promoted to memory"""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        """The bytes stored for the key or None"""
+        blob = self.memory.get(key)
+        if blob is None and self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                self.memory.put(key, blob)
+        return blob
+
+    def put(self, key, blob):
+        """Store the bytes in both tiers"""
+        self.memory.put(key, blob)
+        if self.disk is not None:
+            self.disk.put(key, blob)
+
+    def stats(self):
+        """Counters of both tiers"""
+        res = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            res["disk"] = self.disk.stats()
+        return res
@@ -0,0 +1,241 @@
+"""Pillow rasteriser, doesn't need ImageMagick.
+SVG files are rasterised with cairosvg when it is installed"""
+
+import io
+import os
+from functools import lru_cache
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+try:
+    import cairosvg
+    # Why SVG files can't be opened, None when they can
+    SVG_ERROR = None
+except (ImportError, OSError) as e:  # OSError when the cairo library is missing
+    cairosvg = None
+    SVG_ERROR = e
+
+NAME = "pillow"
+TRANSPARENT = (0, 0, 0, 0)
+# Raised when an image can't be decoded
+IMAGE_ERRORS = (OSError, ValueError)
+# Pillow loads fonts from files, font_family is only used by ImageMagick
+FONT_FILE = os.environ.get("font_file")
+FONT_FILE_BOLD = os.environ.get("font_file_bold") or FONT_FILE
+BOLD_WEIGHT = 600
+
+
+def rgba(color):
+    """Color string or tuple to an RGBA tuple"""
+    if color is None:
+        return TRANSPARENT
+    if isinstance(color, tuple):
+        return color
+    color = str(color)
+    if color in ("transparent", "none"):
+        return TRANSPARENT
+    return ImageColor.getcolor(color, "RGBA")
+
+
+@lru_cache(maxsize=32)
+def load_font(size, bold):
+    """Font of the configured files, Pillow's default font if there are none"""
+    path = FONT_FILE_BOLD if bold else FONT_FILE
+    if path is not None:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+class Drawing:
+    """Records drawing commands like wand.drawing.Drawing and draws them when called on an image.
+    Only the commands used by the themes are implemented"""
+
+    def __init__(self):
+        self.state = {
+            "stroke_color": (0, 0, 0, 0),
+            "stroke_width": 1,
+            "fill_color": (0, 0, 0, 255),
+            "font_family": None,
+            "font_size": 12,
+            "font_weight": 400,
+        }
+        self.stack = []
+        self.commands = []
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.commands = []
+
+    def __getattr__(self, name):
+        state = self.__dict__.get("state")
+        if state is not None and name in state:
+            return state[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        state = self.__dict__.get("state")
+        if state is not None and name in state:
+            if name in ("stroke_color", "fill_color"):
+                value = rgba(value)
+            state[name] = value
+        else:
+            super().__setattr__(name, value)
+
+    def push(self):
+        """Save the current settings"""
+        self.stack.append(dict(self.state))
+
+    def pop(self):
+        """Restore the last saved settings"""
+        self.state.update(self.stack.pop())
+
+    def rectangle(self, left, top, width, height, radius=0):
+        """Rectangle with rounded corners when radius is set"""
+        self.commands.append(("rectangle", dict(self.state), (left, top, width, height, radius)))
+
+    def text(self, x, y, body):
+        """Text starting at x on the baseline y"""
+        self.commands.append(("text", dict(self.state), (x, y, body)))
+
+    def line(self, start, end):
+        """Line between two points"""
+        self.commands.append(("path", dict(self.state), [[start, end]]))
+
+    def path_start(self):
+        """Start a path made of subpaths"""
+        self.path = []
+
+    def path_move(self, to=None, relative=False):
+        """Start a new subpath at a point"""
+        if relative:
+            last = self.path[-1][-1]
+            to = (last[0] + to[0], last[1] + to[1])
+        self.path.append([to])
+
+    def path_line(self, to=None, relative=False):
+        """Continue the subpath with a line to a point"""
+        last = self.path[-1][-1]
+        if relative:
+            to = (last[0] + to[0], last[1] + to[1])
+        self.path[-1].append(to)
+
+    def path_finish(self):
+        """End the path, its subpaths are stroked but not filled"""
+        self.commands.append(("path", dict(self.state), self.path))
+        self.path = None
+
+    def __call__(self, image):
+        """Draw the commands on the image, each command is blended over the previous ones"""
+        for command, state, args in self.commands:
+            with Image.new("RGBA", image.size, TRANSPARENT) as layer:
+                draw = ImageDraw.Draw(layer)
+                stroke = state["stroke_color"] if state["stroke_color"][3] > 0 else None
+                width = max(1, round(state["stroke_width"]))
+                match command:
+                    case "rectangle":
+                        left, top, r_width, r_height, radius = args
+                        draw.rounded_rectangle(
+                            (left, top, left + r_width, top + r_height),
+                            radius=radius or 0,
+                            fill=state["fill_color"],
+                            outline=stroke,
+                            width=width,
+                        )
+                    case "text":
+                        x, y, body = args
+                        font = load_font(
+                            round(state["font_size"]), state["font_weight"] >= BOLD_WEIGHT
+                        )
+                        draw.text((x, y), body, fill=state["fill_color"], font=font, anchor="ls")
+                    case "path":
+                        if stroke is not None:
+                            for subpath in args:
+                                if len(subpath) > 1:
+                                    draw.line(subpath, fill=stroke, width=width)
+                image.alpha_composite(layer)
+
+
+def new_image(width, height):
+    """Transparent image"""
+    return Image.new("RGBA", (width, height), TRANSPARENT)
+
+
+def open_image(path=None, blob=None, background=None):
+    """Decodes a file or bytes, vector files are rasterised on the background color"""
+    if path is not None and path.lower().endswith(".svg"):
+        if cairosvg is None:
+            raise OSError(f"Install cairosvg to render {path} with Pillow")
+        blob = cairosvg.svg2png(url=path, background_color=background)
+        path = None
+    with Image.open(path if path is not None else io.BytesIO(blob)) as image:
+        return image.convert("RGBA")
+
+
+def clone(image):
+    """Copy of the image"""
+    return image.copy()
+
+
+def rotate(image, degrees):
+    """Rotates clockwise, the image grows to fit the corners.
+    The image passed is closed, use the one returned"""
+    if degrees % 360 == 0:
+        return image
+    rotated = image.rotate(
+        -degrees, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=TRANSPARENT
+    )
+    image.close()
+    return rotated
+
+
+def resize(image, width, height):
+    """Resized image. The image passed is closed, use the one returned"""
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    image.close()
+    return resized
+
+
+def composite(base, layer, x=0, y=0, operator="over"):
+    """Draws layer on top of base at x, y. Only the over operator is supported"""
+    if operator != "over":
+        raise ValueError(f"Operator {operator} isn't supported with Pillow")
+    left = max(x, 0)
+    top = max(y, 0)
+    right = min(x + layer.width, base.width)
+    bottom = min(y + layer.height, base.height)
+    if right <= left or bottom <= top:
+        return
+    if (left, top, right, bottom) == (x, y, x + layer.width, y + layer.height):
+        base.alpha_composite(layer, dest=(x, y))
+        return
+    with layer.crop((left - x, top - y, right - x, bottom - y)) as visible:
+        base.alpha_composite(visible, dest=(left, top))
+
+
+def to_png(image):
+    """PNG bytes of the image"""
+    output = io.BytesIO()
+    image.save(output, "png")
+    return output.getvalue()
+
+
+def encode(image, encoding="png", level=None):
+    """Bytes of the image in one of the ENCODINGS, level is the zlib level of PNG files"""
+    output = io.BytesIO()
+    options = {} if level is None else {"compress_level": level}
+    match encoding:
+        case "png8":
+            with image.quantize(256, method=Image.Quantize.FASTOCTREE) as palette:
+                palette.save(output, "png", **options)
+        case "webp":
+            image.save(output, "webp", lossless=True)
+        case _:
+            image.save(output, "png", **options)
+    return output.getvalue()
+
+
+def close(image):
+    """Releases the memory of the image"""
+    image.close()
@@ -1,19 +1,18 @@
 """Renders various graphics"""
 
 import os
-#import base64
 import glob
 import importlib
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from os.path import dirname, basename, isfile, join
 import aiohttp
 from dotenv import load_dotenv
-from wand.image import Image
-from wand.exceptions import BaseError
-from wand.color import Color
-from wand.drawing import Drawing
-from wand.compat import nested
 import render.render_tools as render_tools
+import render.cache as cache
 import render.themes as themes
 
 load_dotenv()
@@ -31,34 +30,107 @@ NB_COL = 9
 
 WIDTH = 540
 HEIGHT = 300
+# Part of the keys of the cached cards and backgrounds, which outlive restarts on disk.
+# Bump it when a change to the drawing code changes what the themes draw
+RENDER_VERSION = 1
+
+# Avatars are requested from the CDN at the smallest size above ICON_SIZE
+AVATAR_SIZE = 128
+AVATAR_CACHE_ENTRIES = int(os.environ.get("avatar_cache_entries") or "1024")
+avatar_cache = cache.LRUCache(AVATAR_CACHE_ENTRIES)
+HTTP_CONNECTIONS = int(os.environ.get("http_connections") or "20")
+HTTP_TIMEOUT = int(os.environ.get("http_timeout") or "30")
+http_session = None
+
+# Cards are rendered by a pool of worker processes, 0 renders in a thread of the bot's process
+RENDER_WORKERS = int(os.environ.get("render_workers") or os.cpu_count() or 1)
+executor = None
+
+# Files of the disk caches unused for this long are deleted, in hours
+DISK_CACHE_MAX_AGE = float(os.environ.get("disk_cache_max_age") or "168")
+# Finished cards, keyed by a hash of everything drawn on them. Sizes in MB
+CARD_CACHE_ENTRIES = int(os.environ.get("card_cache_entries") or "512")
+CARD_CACHE_MEMORY = float(os.environ.get("card_cache_memory") or "32")
+CARD_CACHE_DISK = float(os.environ.get("card_cache_disk") or "256")
+CARD_CACHE_DIR = os.environ.get("card_cache_dir") or os.path.join(TEMP_DIR, "cache", "cards")
+card_cache = cache.TieredCache(
+    cache.LRUCache(CARD_CACHE_ENTRIES, max_bytes=int(CARD_CACHE_MEMORY * 1024 * 1024)),
+    cache.DiskCache(
+        CARD_CACHE_DIR, int(CARD_CACHE_DISK * 1024 * 1024), max_age=DISK_CACHE_MAX_AGE * 3600
+    )
+    if CARD_CACHE_DISK > 0 else None,
+)
+
+# Static layers only depend on the theme and the size of the card
+static_cache = cache.LRUCache(16)
+# Backgrounds only depend on the theme, the seed and the size of the card
+BACKGROUND_CACHE_ENTRIES = int(os.environ.get("background_cache_entries") or "128")
+BACKGROUND_CACHE_DISK = float(os.environ.get("background_cache_disk") or "0")
+BACKGROUND_CACHE_DIR = os.environ.get("background_cache_dir") or os.path.join(
+    TEMP_DIR, "cache", "backgrounds"
+)
+background_cache = cache.TieredCache(
+    cache.LRUCache(BACKGROUND_CACHE_ENTRIES),
+    cache.DiskCache(
+        BACKGROUND_CACHE_DIR,
+        int(BACKGROUND_CACHE_DISK * 1024 * 1024),
+        max_age=DISK_CACHE_MAX_AGE * 3600,
+    )
+    if BACKGROUND_CACHE_DISK > 0 else None,
+)
+
+
+# Theme name to {"init": factory, "path": module file, "version": module modification time}
+theme_registry = {}
+
+
+def reload_themes():
+    """Imports the themes and fills the registry, call again to pick up new or modified themes.
+    Render workers keep the registry they started with"""
+    registry = {}
+    modules = glob.glob(join(f"{dirname(__file__)}/{THEME_DIR}", "*.py"))
+    names = [basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
+    for name in sorted(names):
+        try:
+            pkg = importlib.import_module(f".{name}", "render.themes")
+            if name in theme_registry:
+                pkg = importlib.reload(pkg)
+        except ImportError as e:
+            print(f"Unable to load theme {name}, error {e}")
+            continue
+        registry[name] = {
+            "init": pkg.init,
+            "path": pkg.__file__,
+            "version": os.path.getmtime(pkg.__file__),
+        }
+    theme_registry.clear()
+    theme_registry.update(registry)
+    return list_themes()
 
 
 def load_theme(theme_name):
-    """Loads one of the themes from the database"""
-    all_themes = list_themes()
-    try:
-        pkg = importlib.import_module(f".{theme_name}", "render.themes")
-    except ImportError:
-        name =  all_themes[0]
-        pkg = importlib.import_module(f".{name}", "render.themes")
-    return pkg.init(WIDTH, HEIGHT)
+    """Instance of a theme, the first one is used if the name is unknown"""
+    theme = theme_registry.get(theme_name)
+    if theme is None:
+        theme = next(iter(theme_registry.values()))
+    return theme["init"](WIDTH, HEIGHT)
 
 def list_themes():
     """List all the themes available"""
-    modules = glob.glob(join(f"{dirname(__file__)}/{THEME_DIR}", "*.py"))
-    return [ basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
+    return list(theme_registry)
 
 
 def check_theme_exist(theme_name):
     """Return an error if the theme doesn't exist"""
-    all_themes = list_themes()
-    for theme in all_themes:
-        if theme == theme_name:
-            return False
-    return f"List of available themes: {all_themes}"
+    if theme_name in theme_registry:
+        return False
+    return f"List of available themes: {list_themes()}"
+
+
+reload_themes()
+
 
 def generate_guild_card(
-    path,
     discord_id,
     name,
     currency,
@@ -70,34 +142,201 @@ def generate_guild_card(
     pfp=None,
     next_req_str=None,
 ):
-    """Renders a guild card to a picture"""
-    if achievements is None:
-        achievements = []
+    """Renders a guild card to the bytes of its image"""
+    render_background(theme, discord_id)
+
+    with render_tools.Drawing() as canvas:
+        draw_card_text(theme, canvas, name, currency, balance, points, rank, next_req_str)
+        add_card_images(theme, achievements, pfp)
+        return theme.save_final_render(canvas)
+
+
+def draw_card_text(theme, canvas, name, currency, balance, points, rank, next_req_str=None):
+    """Draws the texts of a guild card on the canvas"""
+    # Title
+    theme.render_title(canvas, name)
+    theme.render_text(canvas, f"Rank {rank}")
+    if next_req_str is not None:
+        theme.render_text(canvas, next_req_str)
+
+    theme.render_text_bold(canvas, currency)
+    theme.render_text(canvas, f"Total: {points} Balance: {balance}")
+    theme.render_text_bold(canvas, "Achievements")
+
+
+def add_card_images(theme, achievements=None, pfp=None):
+    """Adds the profile picture and the achievements of a guild card to the theme's images"""
+    # PFP
+    if pfp is not None:
+        theme.draw_pfp(pfp)
+
+    # Achievements
+    if achievements is not None and len(achievements) > 0:
+        theme.draw_achievements(achievements)
+
+
+def render_static(theme):
+    """PNG bytes of the static layer of the theme, drawn once per theme and size"""
+    name = type(theme).__name__
+    key = (name, theme_registry.get(name, {}).get("version"), theme.width, theme.height)
+    blob = static_cache.get(key)
+    if blob is None:
+        with render_tools.Drawing() as canvas:
+            theme.render_static(canvas)
+            with render_tools.new_image(theme.width, theme.height) as img:
+                canvas(img)
+                blob = render_tools.to_png(img)
+        static_cache.put(key, blob)
+    return blob
+
+
+def render_background(theme, seed):
+    """Sets the background of the theme with its static layer on top,
+    only drawing it if it isn't cached"""
+    name = type(theme).__name__
+    version = theme_registry.get(name, {}).get("version")
+    key = cache.digest(
+        RENDER_VERSION,
+        render_tools.RENDER_BACKEND,
+        name,
+        version,
+        "static",
+        seed,
+        theme.width,
+        theme.height,
+    )
+    blob = background_cache.get(key)
+    if blob is not None:
+        theme.background = blob
+        return
+    with render_tools.Drawing() as bg_canvas:
+        theme.render_background(bg_canvas, seed = seed)
+    with render_tools.open_image(blob=theme.background) as bg:
+        with render_tools.open_image(blob=render_static(theme)) as static:
+            render_tools.composite(bg, static)
+        theme.background = render_tools.to_png(bg)
+    background_cache.put(key, theme.background)
 
-    # Draw background
-    with nested(render_tools.TRANSPARENT, Color("#00000000"), Drawing()) as (b_bg, b_fg, bg_canvas):
-        theme.render_background(bg_canvas, seed = discord_id)
 
-    with nested(render_tools.TRANSPARENT, Color("#00000000"), Drawing()) as (bg, fg, canvas):
-        theme.render_border(canvas)
-        # Title
-        theme.render_title(canvas, name)
-        theme.render_text(canvas, f"Rank {rank}")
-        if next_req_str is not None:
-            theme.render_text(canvas, next_req_str)
+def card_file_name():
+    """File name to upload the cards with"""
+    return render_tools.card_file_name()
 
-        theme.render_text_bold(canvas, currency)
-        theme.render_text(canvas, f"Total: {points} Balance: {balance}")
-        theme.render_text_bold(canvas, "Achievements")
 
-        # PFP
-        if pfp is not None:
-            theme.draw_pfp(pfp)
+def card_job(discord_id, name, currency, balance, points, rank, theme_name,
+    achievements=None, pfp=None, next_req_str=None):
+    """Describes a card to render, only with values that can be sent to a worker process.
+    pfp and achievements are image bytes"""
+    return {
+        "discord_id": discord_id,
+        "name": name,
+        "currency": currency,
+        "balance": balance,
+        "points": points,
+        "rank": rank,
+        "theme": theme_name,
+        "achievements": achievements or [],
+        "pfp": pfp,
+        "next_req_str": next_req_str,
+    }
 
-        # Achievements
-        if len(achievements) > 0:
-            theme.draw_achievements(achievements)
-        theme.save_final_render(canvas, path)
+
+def card_key(job):
+    """Hash of every input of a card job and of the code drawing it, images are hashed by content"""
+    # Unknown themes are drawn with the first one, like load_theme does
+    theme = theme_registry.get(job["theme"]) or next(iter(theme_registry.values()), {})
+    return cache.digest(
+        RENDER_VERSION,
+        render_tools.RENDER_BACKEND,
+        theme.get("version"),
+        WIDTH,
+        HEIGHT,
+        job["discord_id"],
+        job["name"],
+        job["currency"],
+        job["balance"],
+        job["points"],
+        job["rank"],
+        job["theme"],
+        job["next_req_str"],
+        render_tools.CARD_ENCODING,
+        render_tools.CARD_COMPRESSION,
+        job["pfp"],
+        len(job["achievements"]),
+        *job["achievements"],
+    )
+
+
+def render_card(job):
+    """Renders a card job to image bytes, this is what runs in the workers"""
+    return generate_guild_card(
+        job["discord_id"],
+        job["name"],
+        job["currency"],
+        job["balance"],
+        job["points"],
+        job["rank"],
+        load_theme(job["theme"]),
+        achievements=job["achievements"],
+        pfp=job["pfp"],
+        next_req_str=job["next_req_str"],
+    )
+
+
+def get_executor():
+    """Process pool for the renders, started on first use. Without workers a single thread
+    renders, the caches of the renders aren't shared between threads"""
+    # pylint:disable=W0603
+    global executor
+    if executor is None:
+        if RENDER_WORKERS > 0:
+            # Forking the bot, which runs threads, can copy a lock held by one of them
+            executor = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+    return executor
+
+
+async def run_in_worker(function, *args):
+    """Runs a function in the render workers, or the render thread when there are none"""
+    # pylint:disable=W0603
+    global executor
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), function, *args)
+    except BrokenProcessPool:
+        executor = None  # A worker died, start a new pool for the next render
+        raise
+
+
+async def render_uncached(job):
+    """Renders a card job to image bytes without blocking the event loop"""
+    return await run_in_worker(render_card, job)
+
+
+def cache_stats():
+    """Counters of the caches of this process, render workers keep their own"""
+    return {
+        "cards": card_cache.stats(),
+        "backgrounds": background_cache.stats(),
+        "sprites": render_tools.sprite_cache.stats(),
+        "decoded": render_tools.decoded_cache.stats(),
+        "strips": render_tools.strip_cache.stats(),
+        "avatars": avatar_cache.stats(),
+    }
+
+
+def clean_caches():
+    """Evict the disk cache files that are too old and delete the files
+    left in the working directory by previous versions"""
+    for tiered in [card_cache, background_cache]:
+        if tiered.disk is not None:
+            tiered.disk.evict()
+    legacy = glob.glob(join(TEMP_DIR, "*_pfp.png"))
+    legacy += glob.glob(join(TEMP_DIR, "render", "ach_*.png"))
+    legacy += glob.glob(join(TEMP_DIR, "render", "*_card.png"))
+    clear_cache(*legacy)
 
 
 def clear_cache(*args):
@@ -107,16 +346,61 @@ def clear_cache(*args):
             try:
                 os.remove(file)
             except OSError:
-                return
+                continue
+
+
+def get_session():
+    """HTTP session shared by every download, created on first use"""
+    # pylint:disable=W0603
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return http_session
+
+
+async def close_session():
+    """Close the shared HTTP session"""
+    if http_session is not None:
+        await http_session.close()
 
 
 async def download(url):
     """url to blob"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                res = await resp.read()
-                return res
+    async with get_session().get(url) as resp:
+        if resp.status == 200:
+            res = await resp.read()
+            return res
+
+
+async def fetch_avatar(url, key):
+    """Avatar resized to ICON_SIZE, asks the CDN if it changed once it's older than CACHE_DURATION.
+    Serves the cached avatar if the CDN can't be reached"""
+    entry = avatar_cache.get(key)
+    now = datetime.now()
+    if entry is not None and entry["checked"] > now - timedelta(hours=CACHE_DURATION):
+        return entry["blob"]
+    headers = {}
+    if entry is not None and entry["etag"] is not None:
+        headers["If-None-Match"] = entry["etag"]
+    stale = entry["blob"] if entry is not None else None
+    try:
+        async with get_session().get(url, headers=headers) as resp:
+            if resp.status == 304 and entry is not None:
+                entry["checked"] = now
+                return entry["blob"]
+            if resp.status != 200:
+                return stale
+            blob = await resp.read()
+            etag = resp.headers.get("ETag")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Unable to download {url}, error {e}")
+        return stale
+    blob = await run_in_worker(resize, ICON_SIZE, ICON_SIZE, None, blob)
+    avatar_cache.put(key, {"blob": blob, "etag": etag, "checked": now}, size=len(blob))
+    return blob
 
 
 def get_filename(parts, prefix = "", extension=".png"):
@@ -137,50 +421,21 @@ def save(blob, filename):
 
 
 def resize(width, height, filename=None, blob=None):
-    """Resize image and make blob, pass either filename or blob"""
-    with Image(filename=filename, blob=blob) as img:
-        img.resize(width, height)
-        return img.make_blob()
+    """Resize image and make PNG bytes, pass either filename or blob"""
+    return render_tools.resize(width, height, filename=filename, blob=blob)
 
 
-async def cache_images(guild_id, member_id, pfp_url=None):
-    """Downloads the ressources necessary for the render step"""
+async def cache_images(pfp_url=None):
+    """Downloads the ressources necessary for the render step, images are returned as bytes.
+    pfp_url is an url or a discord asset"""
     res = {}
     if pfp_url is not None:
-        filename = f"{TEMP_DIR}/{guild_id}_{member_id}_pfp.png"
         if isinstance(pfp_url, str):
-            try:
-                last_modified = os.path.getmtime(filename)
-                cache_limit = datetime.now() - timedelta(hours=CACHE_DURATION)
-            except OSError:
-                last_modified = None
-            if last_modified is None or last_modified < cache_limit:
-                with open(filename, "wb") as output:
-                    pfp_png = await download(pfp_url)
-                    output.write(resize(ICON_SIZE, ICON_SIZE, blob = pfp_png))
+            url = pfp_url
+            key = pfp_url
         else:
-            blob = await pfp_url.fetch()
-            blob = resize(ICON_SIZE, ICON_SIZE, blob=blob)
-            with open(filename, "wb") as output:
-                output.write(blob)
-        res["pfp"] = filename
+            url = pfp_url.as_url(extension="png", size=AVATAR_SIZE)
+            key = pfp_url.hash or url
+        res["pfp"] = await fetch_avatar(url, key)
     return res
 
-
-# Test
-#profile_icon = "icon.png"
-#base64_code = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAMAAABg3Am1AAAAAXNSR0IArs4c6QAAAARnQU1BAACxjwv8YQUAAAMAUExURQAAAAYAAQAEBgoBAQ8FBA8LBwkHCgwGCg4JCw4OCg4KDRMGBRYGBxIJBxEFCBEFDBEKChAKCxYKChENCxYNCxEKDBQLDRINDhYODhgLCxwNCxoLDhkNDRgPDhoODhwPDQ8RDRYSDxYQDxoSDh0SDxsUDh4VDh8VDw8HFRMLEhEOEBYNEBkPEhwPERgPFBcSEhUVEBcTFRoREhkTEBsSERkREh0RER0TERwTEhkUEhsUERsUEx0UEB8VER0VEh4VEh8WEhoSFh4TFRwTFRkVFR4VFR0VFB8WFB0XFx8YER8YFhcUHhsVGB0WGR8aGyITDiATESEVESEVEyAWEyIWEyEVFSEXFSIXFSIXFiIYEyIZFSEYFiIYFiIXGCIZGSUaGiAeGiceGiEbHiUbHSYdHSoeGyofHCMdISofIiofJCYhISkhIS4hIykgJS8jJyokJi4mJSkiKzAnJjEoJjklKDIqKDczMTsyMD0zMD04OEc6NkE7O0Y7OkA6PUM8PEQ+PUk/P0hCP0c+QUdBQ0tCRkpFRk9GR0pFTk5JTVFDRFRMSlJLTVFOTVtPTlVRT1xST09OUFdSUl5SUltWVlxWVl5XWF9aWmBVUmZdWmNaXGBcXGhdXWpgX3JmX2tkY21jZW5pZWxnaXBpZHVtbXpwbnlxcXx8eoN4dIN6eIV+fYqGho2EhI+OjpKLi5WNi5aTk5qTkJyYl5qZmZ2fmaedmaaenammoq2mo6mlpaqpprOspbCqqLGsqrSsq7Gurbasrbyzrry1rrSwsLiwsrq0tL69t8G9ucXBvcC+wsnFxszGxMrIxdDNy9PRztjSzc/c1NbW1dnV0tjX1dzX1d3Z09nZ2d7b2tvd2N7d2d/b3eHb2ODc2uLe3uTi3+Df4ebi4uLk4eXh5OHl5+jk4+rp5+vq6evu6u7s6+/t7fDs6/Lv7vLw7/Xz7ezx9PX18/P09fT19Pn18fv39fr68/r59v/79vr6+fv++P7++v/8+vv9/f3+/v///P/9/////wAAACPrPuEAAAEAdFJOU////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////wBT9wclAAAACXBIWXMAAA7DAAAOwwHHb6hkAAAEZElEQVRIS61VaXRTRRSuIqIgYgUaENtqS6kWSqGNtDYkKSn0YQSkJGnS10eRQw+gdUGOiIorLiCLC4v7jnVB3MVdATc29wWPIm6oB3EFFS0N3/PeO/Ne0sofz/E7Z+4y832ZeTN3Jhn2f8T/J1iqfUfsRzA+1Gs20DrbqK1q0F1pSAlGB73FA4wW3yNIoTlSaNsz62tPeUWTUgJvYDuKgUGamULhhCp0TrZNrtBELaikIc/dNzJDjEYmmxiWZpPzKqYS5PMATmPT7Fl13jZJgaNvEDfrl91TyNULVQQncvf4Z9milNpaib7aBJRLVEDTk6t1BD7u3BJhixJgR2ZSQsbiGnFl94kbrgWSGAG2RcU4Aa2HS08ebQLGSKg344POIugviZ+NBwUvlPywE59TvDLpge9cHMH94K8mVIlAwqbVZPrQksqDRj5GU7IdNcMmGM8Bx1CSfJVJqGFBoYQyzSW4lN0OYEiXfRjFcfa3p/NyLj+UE2z1kUA+GaXdxf0mtoXNdRKiTH4rV20J/CTY/JJeIKpxLW4mL7sMtFEbiTfQl3x+QrrQnwR31O5BU+Bvyg6hU12GtyxLDRrU4mQOI9+Yx5sS3RghwTR/g3GbxZ+5F6sTltkYjy+nBF5z4iTTrAN4sVcH7cI5CEcMEjAuzM9hDsIJ00okomM5ros3mGYi7scBlKwIE6s8aN+uBcOxB1hIM59kWuY10beVIG7VhaOGnMR0p/a0IMiMI4GjSHMXzuQM9TCsevwxS7Z3ipQFQwnGMaMTilqzyF+xHsgApgKLwEd4J/X1Ba+JoQR8HWjah/YBF3Ao+BgL535ftgU7Ke6jSpWgBHLafPrjQBo62u7git1N7Vi0kp3GZSRQgsuGqeHfuezx5S29r1rTm6NOyGMH7AoIj6AEdgV1/kVtqAzzGQtacKUKjErFcwV2kxrooZyDudiIz8ifr1kERyCfLZWUDj6CM6g5W0RwBJOE4K5F46AZANeAc2oER0BHIXfu36BXoVFzGK6gEn651R0RKFOX34ErsAcEEK1bpWkOHg0+8AzcLWWkBHbswbOASOBWzQW+Cw1te7pxa7sJ0gVevjF76ZrEE9FIJLrkE06Qm75FhDTBmG0zsubNeQ+5MSsem3oxfr7+7A1fA6MK9LhCmoBP+6fmUMmCe3k9T757/4EZ878oLYKhxxXSBI8xrxdwcNiXnTeSi6+tH704mKnHFVIC9dy8Rm1wNdc65G4y/JohSAl4Rai+iMyuyfjwHED9AuFFzRC4gidep6FB8svIguebP6lM6N0RuKVKcAW8p9nwnfw8He5A4H1Kf2Qy3XQ4f1cMVyDvALoet37gU8gJHU+/31V66IHmN9iFK9CFVJTE2FPfzFr30Tt8WQkPU/NpDqOjADf1RBDFPXVGaMpsd9auoOZXTQDmI7RShwrOA8BwBSuq1OA9j78MmqMdYprDcAW238yZ6On2KW8q+mmmxv7vg23qYbrIFSPUFzOS6RfOtv8BvUOe2yDo30UAAAAASUVORK5CYII="
-#si_data = base64_code.encode()
-#si = base64.b64decode(si_data)
-#generate_guild_card(
-#    "render/testrender.png",
-#    161774022764396544,
-#    "Noiregya",
-#    "Coins",
-#    55,
-#    155,
-#    3,
-#    [si, si, si],
-#    pfp=profile_icon,
-#    next_req_str=None,
-#)
\ No newline at end of file
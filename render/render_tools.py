@@ -1,13 +1,46 @@
 """Reusable functions and imports for rendering"""
 import os
 import math
+import logging
+import importlib
 
-from wand.image import Image, CHANNELS
-from wand.exceptions import BaseError
-from wand.color import Color
+from dotenv import load_dotenv
+import render.cache as cache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+# "wand" renders with ImageMagick, "pillow" with Pillow
+RENDER_BACKEND = os.environ.get("render_backend") or "wand"
+backend = importlib.import_module(f"render.{RENDER_BACKEND}_backend")
+Drawing = backend.Drawing
+TRANSPARENT = backend.TRANSPARENT
+IMAGE_ERRORS = backend.IMAGE_ERRORS
+new_image = backend.new_image
+open_image = backend.open_image
+composite = backend.composite
+to_png = backend.to_png
+
+# Encoding of the finished cards: png, png8 (256 colors palette) or webp (lossless)
+ENCODINGS = {"png": "png", "png8": "png", "webp": "webp"}
+CARD_ENCODING = os.environ.get("card_encoding") or "png"
+if CARD_ENCODING not in ENCODINGS:
+    raise ValueError(f"card_encoding must be one of {list(ENCODINGS)}")
+# zlib level of the PNG cards from 0 to 9, the backend's default if unset
+CARD_COMPRESSION = os.environ.get("card_compression")
+CARD_COMPRESSION = None if CARD_COMPRESSION is None else int(CARD_COMPRESSION)
 
-TRANSPARENT = Color("transparent")
 FONT_FAMILY = os.environ.get("font_family")
+# Rasterised theme sprites kept by each render process
+SPRITE_CACHE_ENTRIES = int(os.environ.get("sprite_cache_entries") or "256")
+sprite_cache = cache.LRUCache(SPRITE_CACHE_ENTRIES, on_evict=backend.close)
+# Decoded images, icons and avatars come back on most renders
+DECODED_CACHE_ENTRIES = int(os.environ.get("decoded_cache_entries") or "256")
+decoded_cache = cache.LRUCache(DECODED_CACHE_ENTRIES, on_evict=backend.close)
+# Achievement grids of the members
+STRIP_CACHE_ENTRIES = int(os.environ.get("strip_cache_entries") or "512")
+strip_cache = cache.LRUCache(STRIP_CACHE_ENTRIES)
+# Set once skipping SVG files has been logged
+svg_warned = False
 
 def draw_rect(draw, x, y, width, height, fill=TRANSPARENT, outline=TRANSPARENT, radius=0):
     """Function to draw a rectangle more easily"""
@@ -41,39 +74,133 @@ def rotate(origin, point, angle):
     qy = oy + math.sin(angle) * (px - ox) + math.cos(angle) * (py - oy)
     return qx, qy
 
+def transform(image, description):
+    """Rotates and resizes an image as described, returns the transformed image"""
+    rotation = description.get("rotation") or 0
+    image = backend.rotate(image, rotation)
+    if description.get("resize"):
+        #Adjust size linearily for rotation (imperfect)
+        width = description.get("width")
+        height = description.get("height")
+        r_w = round(width + height * 0.42 * (rotation % 90) / 90)
+        r_h = round(height + width * 0.42 * (rotation % 90) / 90)
+        image = backend.resize(image, r_w, r_h)
+    return image
+
+def load_image(description):
+    """Decoded image of a description, keyed by path or by digest of the blob.
+    The image belongs to the cache and must not be modified or closed"""
+    path = description.get("path")
+    blob = description.get("blob")
+    if path is not None:
+        key = ("path", path, description.get("background"))
+    else:
+        key = ("blob", cache.digest(blob))
+    image = decoded_cache.get(key)
+    if image is None:
+        image = open_image(path=path, blob=blob, background=description.get("background"))
+        decoded_cache.put(key, image)
+    return image
+
+def load_sprite(description):
+    """Sprite already rasterised, rotated and resized, from the cache when possible.
+    The image belongs to the cache and must not be modified or closed"""
+    key = (
+        description.get("path"),
+        description.get("background"),
+        description.get("rotation") or 0,
+        description.get("resize"),
+        description.get("width"),
+        description.get("height"),
+    )
+    image = sprite_cache.get(key)
+    if image is None:
+        image = transform(backend.clone(load_image(description)), description)
+        sprite_cache.put(key, image)
+    return image
+
+def achievement_strip(icons, nb_col, size, space):
+    """Achievement icons composited in a grid of nb_col columns, as PNG bytes.
+    Cached by the icons' content, so a new achievement or icon makes a new strip"""
+    key = cache.digest(nb_col, size, space, *icons)
+    blob = strip_cache.get(key)
+    if blob is not None:
+        return blob
+    step = size + space
+    rows = -(-len(icons) // nb_col)
+    with new_image(min(len(icons), nb_col) * step, rows * step) as strip:
+        for i, icon in enumerate(icons):
+            try:
+                image = load_image({"blob": icon})
+            except IMAGE_ERRORS as e:
+                print(f"Unable to load achievement icon {i}, error {e}")
+                continue
+            composite(strip, image, (i % nb_col) * step, (i // nb_col) * step)
+        blob = to_png(strip)
+    strip_cache.put(key, blob)
+    return blob
+
+def encode(image, encoding=CARD_ENCODING, level=CARD_COMPRESSION):
+    """Bytes of a finished card, the image may be modified"""
+    return backend.encode(image, encoding, level)
+
+def card_file_name():
+    """File name of the cards for the configured encoding"""
+    return f"card.{ENCODINGS[CARD_ENCODING]}"
+
+def resize(width, height, filename=None, blob=None):
+    """Resize image and make PNG bytes, pass either filename or blob"""
+    image = open_image(path=filename, blob=blob)
+    try:
+        image = backend.resize(image, width, height)
+        return to_png(image)
+    finally:
+        backend.close(image)
+
+def can_open(description):
+    """False for SVG files when the backend can't open them, logged the first time"""
+    # pylint:disable=W0603
+    global svg_warned
+    path = description.get("path")
+    if backend.SVG_ERROR is None or path is None or not path.lower().endswith(".svg"):
+        return True
+    if not svg_warned:
+        svg_warned = True
+        logger.warning(
+            "SVG images are skipped, the %s backend can't open them: %s",
+            backend.NAME,
+            backend.SVG_ERROR,
+        )
+    return False
+
 def overlay_images(canvas, image_description):
-    """Overlay images on the canvas"""
+    """Overlay images on the canvas, descriptions with "sprite" set use the sprite cache.
+    Cached images are only copied when they need to be rotated or resized"""
     for i in image_description:
-        image_parm = i.get("path")
-        rotation = i.get("rotation") or 0
-        background = Color(i.get("background") or "transparent")
-        if image_parm is not None:
-            image = Image(filename=image_parm, background=background).clone()
-        else:
-            try:
-                image = Image(blob=i.get("blob")).clone()
-            except BaseError as e:
-                print(f"Unable to load image {i}, error {e}")
-        image.rotate(rotation)
+        if not can_open(i):
+            continue
+        owned = None
+        try:
+            if i.get("sprite"):
+                image = load_sprite(i)
+            else:
+                image = load_image(i)
+                if i.get("rotation") or i.get("resize"):
+                    owned = image = transform(backend.clone(image), i)
+        except IMAGE_ERRORS as e:
+            print(f"Unable to load image {i}, error {e}")
+            continue
         x = i.get("x")
         y = i.get("y")
-        if i.get("resize"):
-            #Adjust size linearily for rotation (imperfect)
-            width = i.get("width")
-            height = i.get("height")
-            r_w = round(width + height * 0.42 * (rotation % 90) / 90)
-            r_h = round(height + width * 0.42 * (rotation % 90) / 90)
-            image.resize(width=r_w, height=r_h)
         operator = i.get("operator") or "over"
         #outline = i.get("outline")
         #radius = i.get("radius")
         #rounded_image = mask_edges(image, radius)
-        canvas.composite_channel(channel=CHANNELS["default_channels"],
-            image=image,
-            left=x,
-            top=y,
-            operator=operator)
-    image_description = []
+        try:
+            composite(canvas, image, x, y, operator)
+        finally:
+            if owned is not None:
+                backend.close(owned)
 
 #def mask_edges(img, radius):  # TODO: doesn't work
 #    res = img.clone()
@@ -0,0 +1,110 @@
+"""Schedules the card renders so a busy guild can't starve the others"""
+
+import os
+import asyncio
+import render.render as render
+import render.cache as cache
+
+# Cards a guild can render at the same time
+GUILD_CONCURRENCY = int(os.environ.get("render_guild_concurrency") or "2")
+# Renders a guild can have waiting or running
+GUILD_QUEUE_MAX = int(os.environ.get("render_guild_queue_max") or "20")
+# Renders waiting or running for all the guilds
+QUEUE_MAX = int(os.environ.get("render_queue_max") or "100")
+# Last card of each member, served when the queue is full
+LAST_CARDS = int(os.environ.get("render_last_cards") or "1024")
+
+
+class RenderQueueFull(Exception):
+    """Too many renders are queued and there is no previous card to show instead"""
+
+
+class RenderScheduler:
+    """Runs the card renders. Identical jobs of a member share the render in flight,
+    each guild renders at most guild_limit cards at once and past guild_queue_max jobs
+    for the guild or queue_max jobs in total the last card of the member is served instead"""
+
+    def __init__(self, guild_limit, guild_queue_max, queue_max, last_cards):
+        self.guild_limit = guild_limit
+        self.guild_queue_max = guild_queue_max
+        self.queue_max = queue_max
+        self.last_cards = cache.LRUCache(last_cards)
+        # (guild, member, card key): task rendering it
+        self.in_flight = {}
+        # guild: [semaphore, jobs waiting or running], removed when the guild has no job
+        self.guilds = {}
+        self.pending = 0
+
+    async def render(self, guild_id, member_id, job):
+        """Image bytes of the card, raises RenderQueueFull when it can't be rendered now"""
+        key = render.card_key(job)
+        member = (guild_id, member_id)
+        flight = (guild_id, member_id, key)
+        png = render.card_cache.memory.get(key)
+        if png is None and flight not in self.in_flight:
+            png = await self.read_disk(key)
+        if png is not None:
+            self.last_cards.put(member, png)
+            return png
+        task = self.in_flight.get(flight)
+        if task is None:
+            guild = self.guilds.get(guild_id)
+            if self.pending >= self.queue_max or (
+                guild is not None and guild[1] >= self.guild_queue_max
+            ):
+                png = self.last_cards.get(member)
+                if png is None:
+                    raise RenderQueueFull(f"{self.pending} cards are waiting to be rendered")
+                return png
+            if guild is None:
+                guild = self.guilds[guild_id] = [asyncio.Semaphore(self.guild_limit), 0]
+            guild[1] += 1
+            self.pending += 1
+            task = asyncio.ensure_future(self.run(flight, guild, job))
+            self.in_flight[flight] = task
+        # Shielded so a caller giving up doesn't cancel the render the others wait for
+        return await asyncio.shield(task)
+
+    async def run(self, flight, guild, job):
+        """Renders a job when its guild has a free slot"""
+        guild_id, member_id, key = flight
+        try:
+            async with guild[0]:
+                png = await render.render_uncached(job)
+            render.card_cache.memory.put(key, png)
+            self.write_disk(key, png)
+            self.last_cards.put((guild_id, member_id), png)
+            return png
+        finally:
+            del self.in_flight[flight]
+            self.pending -= 1
+            guild[1] -= 1
+            if guild[1] == 0:
+                del self.guilds[guild_id]
+
+    @staticmethod
+    async def read_disk(key):
+        """Card from the disk tier of the cache, read in a thread. Hits are promoted to memory"""
+        if render.card_cache.disk is None:
+            return None
+        png = await asyncio.to_thread(render.card_cache.disk.get, key)
+        if png is not None:
+            render.card_cache.memory.put(key, png)
+        return png
+
+    @staticmethod
+    def write_disk(key, png):
+        """Store a card in the disk tier of the cache from a thread, without waiting for it"""
+        if render.card_cache.disk is not None:
+            asyncio.get_running_loop().run_in_executor(None, render.card_cache.disk.put, key, png)
+
+    def stats(self):
+        """Jobs waiting or running"""
+        return {
+            "pending": self.pending,
+            "in_flight": len(self.in_flight),
+            "guilds": {guild_id: guild[1] for guild_id, guild in self.guilds.items()},
+        }
+
+
+scheduler = RenderScheduler(GUILD_CONCURRENCY, GUILD_QUEUE_MAX, QUEUE_MAX, LAST_CARDS)
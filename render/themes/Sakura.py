@@ -1,5 +1,4 @@
 """Sakura theme"""
-from wand.image import Image
 import render.render_tools as render_tools
 import render.base_theme as base_theme
 
@@ -46,11 +45,10 @@ class Sakura(base_theme.BaseTheme):
             radius=self.rx,
         )
         sakura_images = self.sakura_generator(self.width, self.height, seed)
-        with Image(width=self.width, height=self.height, background=render_tools.TRANSPARENT) as img:
+        with render_tools.new_image(self.width, self.height) as img:
             canvas(img)
             render_tools.overlay_images(img, sakura_images)
-            img.format = 'png'
-            self.background = img.make_blob()
+            self.background = render_tools.to_png(img)
 
     def render_title(self, canvas, text, seed = 0):
         """Renders a title for the theme"""
@@ -95,10 +93,10 @@ class Sakura(base_theme.BaseTheme):
         )
 
     def draw_pfp(self, image):
-        """Add the profile picture to the canvas"""
+        """Add the profile picture to the canvas, image is a path or bytes"""
         self.image_desc.append(
             {
-                "path": image,
+                "blob" if isinstance(image, bytes) else "path": image,
                 "x": self.width - self.icon_size - self.margin,
                 "y": self.margin,
                 "outline": render_tools.TRANSPARENT,
@@ -107,20 +105,18 @@ class Sakura(base_theme.BaseTheme):
         )
 
     def draw_achievements(self, achievements):
-        """Add the achievements picture to the canvas"""
+        """Add the achievements picture to the canvas, as a single strip"""
         self.line_h = self.line_h + self.space
-        for i, achieve_icon in enumerate(achievements):
-            col = i // self.nb_col
-            array_w = self.line_w + (i % self.nb_col) * (self.small_icon_size + self.space)
-            array_h = self.line_h + col * (self.small_icon_size + self.space)
-            self.image_desc.append(
-                {
-                    "blob": achieve_icon,
-                    "x": array_w,
-                    "y": array_h,
-                    "outline": render_tools.TRANSPARENT
-                }
-            )
+        self.image_desc.append(
+            {
+                "blob": render_tools.achievement_strip(
+                    achievements, self.nb_col, self.small_icon_size, self.space
+                ),
+                "x": self.line_w,
+                "y": self.line_h,
+                "outline": render_tools.TRANSPARENT
+            }
+        )
 
     def sakura_generator(self, width, height, seed):
         """Draws sakura"""
@@ -170,6 +166,7 @@ class Sakura(base_theme.BaseTheme):
                     "width": round(flower_size),
                     "height": round(flower_size),
                     "operator": "over",
+                    "sprite": True,
                 }
             )
         return sakura_images
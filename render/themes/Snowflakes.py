@@ -1,9 +1,11 @@
 """Snowy theme"""
-from wand.image import Image
 import math
 import render.render_tools as render_tools
 import render.base_theme as base_theme
 
+# cos and sin of the six rotations of a snowflake's branches
+SIXFOLD = tuple((math.cos(math.radians(a * 60)), math.sin(math.radians(a * 60))) for a in range(6))
+
 def init(width, height):
     """Get an instance of the class"""
     return Snowflakes(width, height)
@@ -34,10 +36,9 @@ class Snowflakes(base_theme.BaseTheme):
         canvas.stroke_width = self.stroke
         # Background
         snowflake_generator(canvas, self.width, self.height, seed, self.base_color)
-        with Image(width=self.width, height=self.height, background=render_tools.TRANSPARENT) as img:
+        with render_tools.new_image(self.width, self.height) as img:
             canvas(img)
-            img.format = 'png'
-            self.background = img.make_blob()
+            self.background = render_tools.to_png(img)
 
     def render_title(self, canvas, text, seed = 0):
         """Renders a title for the theme"""
@@ -82,10 +83,10 @@ class Snowflakes(base_theme.BaseTheme):
         )
 
     def draw_pfp(self, image):
-        """Add the profile picture to the canvas"""
+        """Add the profile picture to the canvas, image is a path or bytes"""
         self.image_desc.append(
             {
-                "path": image,
+                "blob" if isinstance(image, bytes) else "path": image,
                 "x": self.width - self.icon_size - self.margin,
                 "y": self.margin,
                 "outline": render_tools.TRANSPARENT,
@@ -94,26 +95,27 @@ class Snowflakes(base_theme.BaseTheme):
         )
 
     def draw_achievements(self, achievements):
-        """Add the achievements picture to the canvas"""
+        """Add the achievements picture to the canvas, as a single strip"""
         self.line_h = self.line_h + self.space
-        for i, achieve_icon in enumerate(achievements):
-            col = i // self.nb_col
-            array_w = self.line_w + (i % self.nb_col) * (self.small_icon_size + self.space)
-            array_h = self.line_h + col * (self.small_icon_size + self.space)
-            self.image_desc.append(
-                {
-                    "blob": achieve_icon,
-                    "x": array_w,
-                    "y": array_h,
-                    "outline": render_tools.TRANSPARENT
-                }
-            )
+        self.image_desc.append(
+            {
+                "blob": render_tools.achievement_strip(
+                    achievements, self.nb_col, self.small_icon_size, self.space
+                ),
+                "x": self.line_w,
+                "y": self.line_h,
+                "outline": render_tools.TRANSPARENT
+            }
+        )
 
 def snowflake_generator(draw, width, height, seed, color):
     """Draws snowflakes"""
     draw.push()
     draw.stroke_color = color
     draw.stroke_width = 1
+    draw.fill_color = render_tools.TRANSPARENT
+    # Every stroke is a subpath of the same path, drawn at once
+    draw.path_start()
 
     step = 0.015 * width
 
@@ -202,12 +204,13 @@ def snowflake_generator(draw, width, height, seed, color):
                     strokes.append([t_south, t_south_2])
             x, y = p
             i = i + 1
-        for stroke in strokes:
-            sox, soy = stroke[0]
-            sx, sy = stroke[1]
-            for a in range(6):
-                rox, roy = render_tools.rotate(origin, (sox, soy), math.radians(a * 60))
-                rx, ry = render_tools.rotate(origin, (sx, sy), math.radians(a * 60))
-                draw.line((rox, roy), (rx, ry))
+        # Strokes relative to the origin, then copied around it for the six branches
+        ox, oy = origin
+        vectors = [(sx - ox, sy - oy, ex - ox, ey - oy) for (sx, sy), (ex, ey) in strokes]
+        for cos, sin in SIXFOLD:
+            for sx, sy, ex, ey in vectors:
+                draw.path_move(to=(ox + cos * sx - sin * sy, oy + sin * sx + cos * sy))
+                draw.path_line(to=(ox + cos * ex - sin * ey, oy + sin * ex + cos * ey))
         strokes = []
+    draw.path_finish()
     draw.pop()
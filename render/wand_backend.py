@@ -0,0 +1,76 @@
+"""ImageMagick rasteriser, through Wand"""
+
+from wand.image import Image, CHANNELS
+from wand.exceptions import BaseError
+from wand.color import Color
+from wand.drawing import Drawing
+
+NAME = "wand"
+# Why SVG files can't be opened, None when they can
+SVG_ERROR = None
+TRANSPARENT = Color("transparent")
+# Raised when an image can't be decoded
+IMAGE_ERRORS = (BaseError,)
+
+
+def new_image(width, height):
+    """Transparent image"""
+    return Image(width=width, height=height, background=TRANSPARENT)
+
+
+def open_image(path=None, blob=None, background=None):
+    """Decodes a file or bytes, vector files are rasterised on the background color"""
+    if path is not None:
+        return Image(filename=path, background=Color(background or "transparent"))
+    return Image(blob=blob)
+
+
+def clone(image):
+    """Copy of the image"""
+    return image.clone()
+
+
+def rotate(image, degrees):
+    """Rotates clockwise, the image grows to fit the corners"""
+    image.rotate(degrees)
+    return image
+
+
+def resize(image, width, height):
+    """Resized image"""
+    image.resize(width=width, height=height)
+    return image
+
+
+def composite(base, layer, x=0, y=0, operator="over"):
+    """Draws layer on top of base at x, y"""
+    base.composite_channel(channel=CHANNELS["default_channels"],
+        image=layer,
+        left=x,
+        top=y,
+        operator=operator)
+
+
+def to_png(image):
+    """PNG bytes of the image"""
+    return image.make_blob("png")
+
+
+def encode(image, encoding="png", level=None):
+    """Bytes of the image in one of the ENCODINGS, level is the zlib level of PNG files.
+    The image may be modified"""
+    if level is not None:
+        # ImageMagick reads the tens as the zlib level and the units as the filter, 5 is adaptive
+        image.compression_quality = level * 10 + 5
+    match encoding:
+        case "png8":
+            return image.make_blob("png8")
+        case "webp":
+            image.options["webp:lossless"] = "true"
+            return image.make_blob("webp")
+    return image.make_blob("png")
+
+
+def close(image):
+    """Releases the ImageMagick resources of the image"""
+    image.close()
@@ -0,0 +1,137 @@
+"""Pending submissions, from the moment images are posted until their review ends"""
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import dao.async_dao as dao
+import dao.submissions as submissions
+
+# "memory" keeps submissions in this process, "postgres" lets them survive restarts
+# and be reviewed through any bot process
+SESSION_STORE = os.environ.get("session_store") or "memory"
+SESSION_DURATION = float(os.environ.get("session_duration") or "72")  # In hours
+SESSION_MAX = int(os.environ.get("session_max") or "10000")
+
+
+def new_record(member, message, images, users, expires):
+    """A submission as handled by the business"""
+    return {
+        "member": member,
+        "message": message,
+        "images": images,
+        "users": users,
+        "type": None,
+        "name": None,
+        "effect": None,
+        "locked": False,
+        "expires": expires,
+    }
+
+
+class MemoryStore:
+    """Submissions kept in memory, oldest ones are evicted when expired or over max_size"""
+
+    def __init__(self, duration, max_size):
+        self.duration = timedelta(hours=duration)
+        self.max_size = max_size
+        self.records = OrderedDict()
+
+    def evict(self):
+        """Submissions all last as long, so insertion order is also expiry order"""
+        now = datetime.now()
+        while len(self.records) > 0:
+            key, record = next(iter(self.records.items()))
+            if record["expires"] > now and len(self.records) <= self.max_size:
+                return
+            del self.records[key]
+
+    async def create(self, member, message, images, users):
+        """Start tracking a submission"""
+        key = (int(member), int(message))
+        self.records.pop(key, None)
+        self.records[key] = new_record(
+            key[0], key[1], images, users, datetime.now() + self.duration
+        )
+        self.evict()
+
+    async def get(self, member, message):
+        """The submission or None if it doesn't exist or expired"""
+        self.evict()
+        record = self.records.get((int(member), int(message)))
+        if record is None or record["expires"] <= datetime.now():
+            return None
+        return record
+
+    async def update(self, member, message, request_type=None, name=None, effect=None):
+        """Set the fields that are given"""
+        record = await self.get(member, message)
+        if record is None:
+            return
+        if request_type is not None:
+            record["type"] = request_type
+        if name is not None:
+            record["name"] = name
+        if effect is not None:
+            record["effect"] = effect
+
+    async def lock(self, member, message):
+        """True if the lock was obtained, only one reviewer can get it"""
+        record = await self.get(member, message)
+        if record is None or record["locked"]:
+            return False
+        record["locked"] = True
+        return True
+
+    async def delete(self, member, message):
+        """Stop tracking a submission"""
+        self.records.pop((int(member), int(message)), None)
+
+
+class PostgresStore:
+    """Submissions saved in the submissions table"""
+
+    def __init__(self, duration):
+        self.duration = timedelta(hours=duration)
+
+    async def create(self, member, message, images, users):
+        """Start tracking a submission"""
+        # The database computes the expiry so it compares with its own clock
+        await dao.insert_submission(
+            int(member), int(message), images, users, self.duration.total_seconds()
+        )
+
+    async def get(self, member, message):
+        """The submission or None if it doesn't exist or expired"""
+        row = await dao.get_submission(int(member), int(message))
+        if row is None:
+            return None
+        record = new_record(
+            row[submissions.MEMBER],
+            row[submissions.MESSAGE],
+            row[submissions.IMAGES],
+            [int(user) for user in row[submissions.USERS]],
+            row[submissions.EXPIRES],
+        )
+        record["type"] = row[submissions.REQUEST_TYPE]
+        record["name"] = row[submissions.REQUEST_NAME]
+        record["effect"] = row[submissions.EFFECT]
+        record["locked"] = row[submissions.LOCKED]
+        return record
+
+    async def update(self, member, message, request_type=None, name=None, effect=None):
+        """Set the fields that are given"""
+        await dao.update_submission(int(member), int(message), request_type, name, effect)
+
+    async def lock(self, member, message):
+        """True if the lock was obtained, only one reviewer can get it"""
+        return await dao.lock_submission(int(member), int(message))
+
+    async def delete(self, member, message):
+        """Stop tracking a submission"""
+        await dao.delete_submission(int(member), int(message))
+
+
+if SESSION_STORE == "postgres":
+    store = PostgresStore(SESSION_DURATION)
+else:
+    store = MemoryStore(SESSION_DURATION, SESSION_MAX)
@@ -0,0 +1,189 @@
+"""The hot queries must read the indexes of migration 1.0.12 instead of scanning
+and sorting the tables: members by rank, then requests, rewards and achievements by guild
+and the attributions removed with them.
+Runs against the database of test_database_dsn, the tables are created in a throwaway schema"""
+
+import os
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+pytest.importorskip("psycopg_pool")
+# pylint:disable=C0413
+from update import get_sql_to_execute, SQL_DIRECTORY
+from dao.async_dao import Statement
+import dao.members as members
+import dao.requests as requests
+import dao.rewards as rewards
+import dao.achievements as achievements
+
+DSN = os.environ.get("test_database_dsn")
+SCHEMA = "narga_query_plans"
+INDEX = "members_guild_points_idx"
+GUILD = 1
+MEMBERS = 100_000
+# Smaller guilds so filtering on the guild matters
+OTHER_GUILDS = [2, 3, 4]
+OTHER_MEMBERS = 10_000
+LIMIT = 10
+# Requests, rewards and achievements are spread over many guilds with a few each
+GUILDS = 2000
+PER_GUILD = 20
+
+pytestmark = pytest.mark.skipif(DSN is None, reason="test_database_dsn isn't set")
+
+
+@pytest.fixture(scope="module")
+def cursor():
+    """Cursor on a schema with every migration applied and the tables seeded"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    previous = os.getcwd()
+    os.chdir(root)  # The migrations are listed relative to the repository
+    try:
+        scripts = [os.path.join(root, SQL_DIRECTORY, sql) for sql in get_sql_to_execute("0.0.0")]
+    finally:
+        os.chdir(previous)
+    with psycopg.connect(DSN, autocommit=True) as connection:
+        with connection.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+            cur.execute(f"SET search_path TO {SCHEMA}")
+            for script in scripts:
+                with open(script, "r", encoding="utf-8") as sql:
+                    cur.execute(sql.read())
+            cur.execute(
+                "INSERT INTO members (guild, id, nickname, points, next_submission_time) "
+                "SELECT %s, i, 'member ' || i, (i * 7919) %% 5000, NOW() "
+                "FROM generate_series(1, %s) i",
+                [GUILD, MEMBERS],
+            )
+            for guild in OTHER_GUILDS:
+                cur.execute(
+                    "INSERT INTO members (guild, id, nickname, points, next_submission_time) "
+                    "SELECT %s, i, 'member ' || i, (i * 104729) %% 5000, NOW() "
+                    "FROM generate_series(1, %s) i",
+                    [guild, OTHER_MEMBERS],
+                )
+            cur.execute(
+                "INSERT INTO requests (guild, request_type, request_name, effect, value) "
+                "SELECT g, 'type ' || i %% 4, 'name ' || i, 'effect', i "
+                "FROM generate_series(1, %s) g, generate_series(1, %s) i",
+                [GUILDS, PER_GUILD],
+            )
+            cur.execute(
+                "INSERT INTO rewards (guild, r_name, condition, nature, r_role, points_required) "
+                "SELECT g, 'reward ' || i, 'bought', 'role', i, i * 10 "
+                "FROM generate_series(1, %s) g, generate_series(1, %s) i",
+                [GUILDS, PER_GUILD],
+            )
+            cur.execute(
+                "INSERT INTO achievements (guild, a_name, icon, condition, description) "
+                "SELECT g, 'achievement ' || i, '\\x00'::bytea, '{}', 'description' "
+                "FROM generate_series(1, %s) g, generate_series(1, %s) i",
+                [GUILDS, PER_GUILD],
+            )
+            # Every reward, request and achievement of the first guilds given to a few members
+            for table, column, source in [
+                ("reward_attr", "reward", "rewards"),
+                ("request_attr", "request", "requests"),
+                ("achievement_attr", "achievement", "achievements"),
+            ]:
+                cur.execute(
+                    f"INSERT INTO {table} (guild, member, {column}) "
+                    f"SELECT guild, m, ident FROM {source}, generate_series(1, 20) m "
+                    "WHERE guild <= 200"
+                )
+            cur.execute("VACUUM ANALYZE")
+            try:
+                yield cur
+            finally:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+
+def plan_nodes(plan):
+    """Every node of a JSON plan"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, table_function, *args):
+    """Nodes of the plan of the statement issued by a table function"""
+    statement = Statement()
+    table_function(statement, *args)
+    return explain_query(cur, statement.query, statement.params)
+
+
+def explain_query(cur, query, params):
+    """Nodes of the plan of a query"""
+    cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+    return list(plan_nodes(cur.fetchone()[0][0]["Plan"]))
+
+
+def assert_index_scan(nodes, table=members.TABLE_NAME, index=INDEX, sort=False):
+    """The table is read through the index, without a scan of the table.
+    Unless sort is set the rows must come out of the index in order"""
+    kinds = [node["Node Type"] for node in nodes]
+    assert sort or "Sort" not in kinds, kinds
+    assert not any(
+        node["Node Type"] == "Seq Scan" and node.get("Relation Name") == table
+        for node in nodes
+    ), kinds
+    assert any(
+        node["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+        and node.get("Index Name") == index
+        for node in nodes
+    ), kinds
+
+
+@pytest.mark.parametrize("member_id", [1, MEMBERS // 2, MEMBERS])
+def test_rank(cursor, member_id):
+    """Counting the members ranked before one"""
+    assert_index_scan(explain(cursor, members.rank_of, GUILD, member_id))
+
+
+def test_top(cursor):
+    """First page of the leaderboard"""
+    assert_index_scan(explain(cursor, members.top, GUILD, LIMIT))
+
+
+def test_bottom(cursor):
+    """Last page of the leaderboard"""
+    assert_index_scan(explain(cursor, members.bottom, GUILD, LIMIT))
+
+
+@pytest.mark.parametrize("member_id", [1, MEMBERS // 2, MEMBERS])
+def test_window(cursor, member_id):
+    """Members ranked around one, used for the leaderboard pages"""
+    points = (member_id * 7919) % 5000
+    assert_index_scan(explain(cursor, members.ranked_above, GUILD, member_id, points, LIMIT))
+    assert_index_scan(explain(cursor, members.ranked_below, GUILD, member_id, points, LIMIT))
+
+
+def test_request(cursor):
+    """A request looked up by its type, name and effect"""
+    nodes = explain(cursor, requests.selectOne, GUILDS // 2, "type 1", "name 5", "effect")
+    assert_index_scan(nodes, requests.TABLE_NAME, "requests_guild_idx")
+
+
+# A guild has few rewards and achievements, sorting them after a bitmap scan of the index
+# is as good as reading the index in order, what matters is not scanning every guild
+def test_rewards(cursor):
+    """The rewards of a guild, in the order they were added"""
+    nodes = explain(cursor, rewards.select, GUILDS // 2)
+    assert_index_scan(nodes, rewards.TABLE_NAME, "rewards_guild_idx", sort=True)
+
+
+def test_achievements(cursor):
+    """The achievements of a guild, in the order they were added"""
+    nodes = explain(cursor, achievements.select, GUILDS // 2)
+    assert_index_scan(nodes, achievements.TABLE_NAME, "achievements_guild_idx", sort=True)
+
+
+@pytest.mark.parametrize(
+    "table, column",
+    [("reward_attr", "reward"), ("request_attr", "request"), ("achievement_attr", "achievement")],
+)
+def test_attribution_cascade(cursor, table, column):
+    """Deleting a reward, request or achievement deletes its attributions with this statement"""
+    nodes = explain_query(cursor, f"DELETE FROM ONLY {table} WHERE %s = {column}", [5])
+    assert_index_scan(nodes, table, f"{table}_{column}_idx")
@@ -1,7 +1,7 @@
 """Reusable unitary functions"""
 
 # Imports
-import os
+import io
 import logging
 from datetime import datetime
 import json
@@ -15,8 +15,9 @@ from interactions import (
     Button,
     ButtonStyle,
     ActionRow,
+    File,
 )
-import dao.dao as dao
+import dao.async_dao as dao
 import dao.members as members
 import dao.guilds as guilds
 import dao.requests as requests
@@ -51,9 +52,9 @@ def check_in_guild(context):
         return "This command isn't available outside of a guild"
 
 
-def check_guild_setup(guild_id):
+async def check_guild_setup(guild_id):
     """Check if the setup have been performed for this guild"""
-    db_guild = dao.get_guild(guild_id)
+    db_guild = await dao.get_guild(guild_id)
     if db_guild is None:
         return [False, "Please register this guild by using the /setup command"]
     return [True, db_guild]
@@ -92,8 +93,7 @@ def generate_achievements(db_achievements):
     for ach in db_achievements:
         db_ident = str(ach[achievements.IDENT])
         filename = render.get_filename(["ach", ach[achievements.GUILD], db_ident], extension=".png")
-        path = os.path.abspath(f"render/{filename}")
-        render.save(ach[achievements.ICON], path)
+        icon = File(io.BytesIO(bytes(ach[achievements.ICON])), file_name=filename)
         ident = EmbedField(
             name="Decription: ",
             value=ach[achievements.DESCRIPTION],
@@ -109,30 +109,10 @@ def generate_achievements(db_achievements):
         )
         embed.set_footer(f"Id: {db_ident}")
         embed.set_thumbnail(f"attachment://{filename}")
-        embed_pairs.append((path, embed))
+        embed_pairs.append((icon, embed))
     return embed_pairs
 
 
-def generate_leaderboard(db_leaderboard, currency):
-    """Generate a leaderboard in a list of embeds to be paginated"""
-    chunk_size = 15
-    embeds = []
-    ranks, names, points = [], [], []
-    for i, member_rank in enumerate(db_leaderboard):
-        ranks.append(member_rank[0])
-        names.append(member_rank[2])
-        points.append(member_rank[3])
-        if i == 2:
-            embeds.append(generate_podium(names, points, currency))
-            ranks, names, points = [], [], []
-        elif (i - 2) % chunk_size == 0:
-            embeds.append(generate_rank_embeds(ranks, names, points, currency))
-            ranks, names, points = [], [], []
-    if len(ranks) > 0:
-        embeds.append(generate_rank_embeds(ranks, names, points, currency))
-    return embeds
-
-
 def generate_podium(names, points, currency):
     """Generate a page of the leaderboard"""
     number_1 = EmbedField(
@@ -252,9 +232,9 @@ def calculate_prev_submission_time(previous_next, cooldown):
     )
 
 
-def request_per_column(guild_id, request_type=None, name=None, effect=None):
+async def request_per_column(guild_id, request_type=None, name=None, effect=None):
     """Groups every column in lists"""
-    db_requests = dao.get_requests(guild_id, request_type, name, effect)
+    db_requests = await dao.get_requests(guild_id, request_type, name, effect)
     request_type = []
     name = []
     effect = []
@@ -267,9 +247,9 @@ def request_per_column(guild_id, request_type=None, name=None, effect=None):
     return {"type": request_type, "name": name, "effect": effect, "value": value}
 
 
-def ordered_requests(guild_id, request_type=None, name=None, effect=None):
+async def ordered_requests(guild_id, request_type=None, name=None, effect=None):
     """Groups every column in a 3-dimensional dictionnary"""
-    db_requests = dao.get_requests(guild_id, request_type, name, effect)
+    db_requests = await dao.get_requests(guild_id, request_type, name, effect)
     all_req = {}
     for request in db_requests:
         type_dict = all_req.get(request[requests.REQUEST_TYPE])